@@ -1,15 +1,46 @@
 #!/usr/bin/env python3
-from scapy.all import rdpcap, raw
-import sys, itertools
+import mmap
+import struct
+import sys
+
+GLOBAL_HDR = 24
+RECORD_HDR = 16
+
+
+def records(mm):
+    """Yield (offset, caplen) of every packet record in a mapped pcap."""
+    magic = mm[:4]
+    if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+        fmt = "<8xI"
+    elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+        fmt = ">8xI"
+    else:
+        sys.exit("not a pcap file")
+    off = GLOBAL_HDR
+    while off + RECORD_HDR <= len(mm):
+        (caplen,) = struct.unpack_from(fmt, mm, off)
+        yield off + RECORD_HDR, caplen
+        off += RECORD_HDR + caplen
+
+
+def open_pcap(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
 
 f1, f2 = sys.argv[1:3]
-p1, p2 = rdpcap(f1), rdpcap(f2)
+mm1, mm2 = open_pcap(f1), open_pcap(f2)
 
-if len(p1) != len(p2):
-    sys.exit(f"different packet counts: {len(p1)} vs {len(p2)}")
+n1 = sum(1 for _ in records(mm1))
+n2 = sum(1 for _ in records(mm2))
+if n1 != n2:
+    sys.exit(f"different packet counts: {n1} vs {n2}")
 
-for i, (a, b) in enumerate(itertools.zip_longest(p1, p2), 1):
-    if raw(a) != raw(b):
-        sys.exit(f"first difference at packet #{i}")
+v1, v2 = memoryview(mm1), memoryview(mm2)
+for i, ((o1, c1), (o2, c2)) in enumerate(zip(records(mm1), records(mm2)), 1):
+    a, b = v1[o1 : o1 + c1], v2[o2 : o2 + c2]
+    if a != b:
+        byte = next((j for j, (x, y) in enumerate(zip(a, b)) if x != y), min(c1, c2))
+        sys.exit(f"first difference at packet #{i}, byte {byte}")
 
 print("captures are identical")
@@ -4,10 +4,18 @@ Write a 3-second PCAP:
   • sec 0  : five baseline flows
   • sec 1-2: baseline flows + 50 Mbit/s DNS-amplification traffic
 Packets are never transmitted – we only produce flows.pcap.
+
+Frames are assembled directly as bytes: every flow owns one pre-built
+Ether|IP|TCP/UDP|payload template and only the fields that change between
+packets (source MAC/IP and the checksums covering them) are patched in place.
 """
 
-from scapy.all import Ether, IP, UDP, TCP, Raw, wrpcap
-import time, itertools
+import heapq
+import socket
+import struct
+import time
+
+import numpy as np
 
 # ------------ topology -------------------------------------------------
 SERVER_IP = "192.168.1.100"
@@ -47,42 +55,172 @@ DDOS_SRC_IPS = [f"198.51.100.{i}" for i in range(1, 251)]  # 250 bots
 DDOS_SRC_MAC = "de:ad:be:ef:00:%02x"  # template
 # -----------------------------------------------------------------------
 
-DURATION = 3  # seconds 0, 1, 2
-pkts, t0 = [], time.time()
+# ---------- frame layout (byte offsets into Ether|IPv4|L4) -------------
+ETH_SRC = slice(6, 12)
+IP_HDR = slice(14, 34)
+IP_CHKSUM = slice(24, 26)
+IP_SRC = slice(26, 30)
+L4_OFF = 34
+PROTO_NUM = {"TCP": 6, "UDP": 17}
+L4_CHKSUM_OFF = {"TCP": L4_OFF + 16, "UDP": L4_OFF + 6}
+# -----------------------------------------------------------------------
+
+
+def mac_bytes(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(":", ""))
+
+
+def ones_sum(data: bytes) -> int:
+    """Unfolded one's-complement sum of big-endian 16-bit words."""
+    if len(data) % 2:
+        data += b"\0"
+    return sum(struct.unpack(f"!{len(data) // 2}H", data))
+
+
+def fold_checksum(total: int) -> int:
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def build_template(src_mac, src_ip, proto, sport, dport, payload):
+    """
+    Build one complete frame (scapy's default header values) and return it
+    together with the partial L4 checksum that excludes the source IP, so the
+    source address can later be swapped without re-summing the payload.
+    """
+    if proto == "TCP":
+        # seq=0, ack=0, dataofs=5, flags=S, window=8192, urgptr=0
+        l4 = struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 5 << 4, 0x02, 8192, 0, 0)
+    else:
+        l4 = struct.pack("!HHHH", sport, dport, 8 + len(payload), 0)
+    segment = l4 + payload
+    ip = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + len(segment),
+        1,
+        0,
+        64,
+        PROTO_NUM[proto],
+        0,
+        socket.inet_aton(src_ip),
+        socket.inet_aton(SERVER_IP),
+    )
+    buf = bytearray(mac_bytes(SERVER_MAC) + mac_bytes(src_mac) + b"\x08\x00")
+    buf += ip + segment
+
+    pseudo = socket.inet_aton(SERVER_IP) + struct.pack(
+        "!BBH", 0, PROTO_NUM[proto], len(segment)
+    )
+    l4_partial = ones_sum(pseudo + segment)
+    set_source(buf, proto, l4_partial, src_mac=None, src_ip=src_ip)
+    return buf, l4_partial
+
+
+def set_source(buf, proto, l4_partial, *, src_mac, src_ip):
+    """Patch source MAC/IP into *buf* and refresh both checksums."""
+    if src_mac is not None:
+        buf[ETH_SRC] = mac_bytes(src_mac)
+    ip_raw = socket.inet_aton(src_ip)
+    buf[IP_SRC] = ip_raw
+
+    buf[IP_CHKSUM] = b"\0\0"
+    buf[IP_CHKSUM] = struct.pack("!H", fold_checksum(ones_sum(buf[IP_HDR])))
+
+    l4_csum = fold_checksum(l4_partial + ones_sum(ip_raw))
+    if proto == "UDP" and l4_csum == 0:
+        l4_csum = 0xFFFF
+    struct.pack_into("!H", buf, L4_CHKSUM_OFF[proto], l4_csum)
 
-for sec in range(DURATION):
-    # ---------------- baseline test traffic ---------------------------
-    for i, f in enumerate(FLOWS):
-        pps = f["rate"] // 8 // f["size"]
-        for n in range(int(pps)):
-            eth = Ether(src=CLIENT_MACS[i], dst=SERVER_MAC)
-            ip = IP(src=CLIENT_IPS[i], dst=SERVER_IP)
-            l4 = (
-                TCP(sport=f["sport"], dport=f["dport"], flags="S")
-                if f["proto"] == "TCP"
-                else UDP(sport=f["sport"], dport=f["dport"])
-            )
-            pkt = eth / ip / l4 / Raw(b"x" * f["size"])
-            pkt.time = t0 + sec + n / pps
-            pkts.append(pkt)
 
+def record_tail(frame: bytes) -> bytes:
+    """
+    Serialise everything of a pcap record except its timestamp: the
+    caplen/len half of the record header followed by the frame. Packets
+    sharing a template share this object, so it is built only once.
+    """
+    return struct.pack("<II", len(frame), len(frame)) + frame
+
+
+def write_pcap(path, records) -> int:
+    """
+    Write (timestamp, record_tail) records as a classic little-endian pcap
+    and return how many were written.
+    """
+    count = 0
+    pack_ts = struct.Struct("<II").pack
+    with open(path, "wb", buffering=1 << 20) as out:
+        out.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for ts, tail in records:
+            sec = int(ts)
+            usec = int(round((ts - sec) * 1_000_000))
+            if usec >= 1_000_000:
+                sec, usec = sec + 1, usec - 1_000_000
+            out.write(pack_ts(sec, usec))
+            out.write(tail)
+            count += 1
+    return count
+
+
+SECONDS = range(3)  # seconds 0, 1, 2
+t0 = time.time()
+
+flow_records = [
+    record_tail(
+        build_template(
+            CLIENT_MACS[i],
+            CLIENT_IPS[i],
+            f["proto"],
+            f["sport"],
+            f["dport"],
+            b"x" * f["size"],
+        )[0]
+    )
+    for i, f in enumerate(FLOWS)
+]
+ddos_template, ddos_l4_partial = build_template(
+    DDOS_SRC_MAC % 0, DDOS_SRC_IPS[0], "UDP", DDOS_SPORT, DDOS_DPORT, b"X" * DDOS_SIZE
+)
+
+
+def ddos_record(src_mac: str, src_ip: str) -> bytes:
+    buf = bytearray(ddos_template)
+    set_source(buf, "UDP", ddos_l4_partial, src_mac=src_mac, src_ip=src_ip)
+    return record_tail(bytes(buf))
+
+
+# the bot rotation restarts every second, so one second of records is reused
+pps_ddos = DDOS_RATE // 8 // DDOS_SIZE
+ddos_records = [
+    ddos_record(DDOS_SRC_MAC % (n % 256), DDOS_SRC_IPS[n % len(DDOS_SRC_IPS)])
+    for n in range(pps_ddos)
+]
+
+
+def periodic_stream(records, seconds):
+    """
+    Yield ascending (timestamp, record) pairs: ``len(records)`` evenly spaced
+    packets in every second of *seconds*, cycling through *records*.
+    """
+    frac = np.arange(len(records)) / len(records)
+    for sec in seconds:
+        yield from zip((t0 + sec + frac).tolist(), records)
+
+
+streams = [
+    # ---------------- baseline test traffic ---------------------------
+    *(
+        periodic_stream([flow_records[i]] * (f["rate"] // 8 // f["size"]), SECONDS)
+        for i, f in enumerate(FLOWS)
+    ),
     # ---------------- DNS-amplification traffic -----------------------
-    if sec in DDOS_SECONDS:
-        pps_ddos = DDOS_RATE // 8 // DDOS_SIZE
-        src_cycle = itertools.cycle(DDOS_SRC_IPS)
-        for n in range(int(pps_ddos)):
-            src_ip = next(src_cycle)
-            src_mac = DDOS_SRC_MAC % (n % 256)
-            eth = Ether(src=src_mac, dst=SERVER_MAC)
-            ip = IP(src=src_ip, dst=SERVER_IP)
-            l4 = UDP(sport=DDOS_SPORT, dport=DDOS_DPORT)
-            pkt = eth / ip / l4 / Raw(b"X" * DDOS_SIZE)
-            pkt.time = t0 + sec + n / pps_ddos
-            pkts.append(pkt)
-
-# ------------------ ensure chronological order -------------------------
-pkts.sort(key=lambda p: p.time)  # <-- NEW LINE
+    periodic_stream(ddos_records, sorted(DDOS_SECONDS)),
+]
 
 # ----------------------- write PCAP ------------------------------------
-wrpcap("flows.pcap", pkts)
-print(f"wrote flows.pcap with {len(pkts):,} packets in strict time order")
+# every stream is ascending, so a lazy k-way merge yields strict time order
+# without materialising the capture
+count = write_pcap("flows.pcap", heapq.merge(*streams, key=lambda p: p[0]))
+print(f"wrote flows.pcap with {count:,} packets in strict time order")
@@ -11,9 +11,15 @@ Usage
 -----
     python sum_ip_len_bins.py capture.pcap
 
+The capture must be a classic libpcap file with Ethernet link type.
+pcapng files are rejected; convert them first with
+``editcap -F pcap capture.pcapng capture.pcap``.
+
 Options
 -------
     -b, --bin-size FLOAT   Width of time bin in seconds (default: 1.0)
+    -j, --jobs INT         Worker processes for large captures
+                           (default: number of CPUs)
 
 Example
 -------
@@ -25,16 +31,37 @@ Example
 
 Requirements
 ------------
-    pip install scapy
+    pip install numpy
 
 """
 
 import argparse
-from collections import defaultdict
-from scapy.utils import PcapReader
-from scapy.layers.inet import IP
+import functools
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
+
+# magic -> (byte order, timestamp fraction scale)
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+GLOBAL_HDR = 24
+LINKTYPE = 20  # offset of the link type in the global header
+LINKTYPE_ETHERNET = 1
+RECORD_HDR = 16
+ETH_TYPE = 12  # offset of EtherType in the frame
+ETH_IPV4 = 0x0800
+ETH_VLAN = 0x8100
+CHUNK_BYTES = 64 << 20  # capture bytes handed to one worker
+
 
 def parse_args() -> argparse.Namespace:
     """Parse command‑line arguments."""
@@ -49,36 +76,133 @@ def parse_args() -> argparse.Namespace:
         default=1.0,
         help="Width of each time bin in seconds (default: 1.0)",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes for large captures (default: number of CPUs)",
+    )
     return parser.parse_args()
 
 
+def record_offsets(mm: mmap.mmap, order: str) -> np.ndarray:
+    """Byte offsets of all record headers (the only sequential pass)."""
+    fmt = order + "8xI"
+    offsets = []
+    off = GLOBAL_HDR
+    while off + RECORD_HDR <= len(mm):
+        offsets.append(off)
+        off += RECORD_HDR + struct.unpack_from(fmt, mm, off)[0]
+    return np.array(offsets, dtype=np.int64)
+
+
+def gather(buf: np.ndarray, offsets: np.ndarray, dtype: str) -> np.ndarray:
+    """Read one fixed-width field at every offset (strided byte gather)."""
+    dt = np.dtype(dtype)
+    idx = np.minimum(offsets, len(buf) - dt.itemsize)[:, None] + np.arange(dt.itemsize)
+    return buf[idx].view(dt).ravel()
+
+
+def sum_chunk(
+    path: Path,
+    offsets: np.ndarray,
+    order: str,
+    ts_scale: float,
+    first_ts: float,
+    bin_size: float,
+) -> tuple[int, np.ndarray]:
+    """Per-bin IPv4 Total Length sums of the records starting at *offsets*.
+
+    Returns the index of the first bin and the sums from that bin on; bins
+    before the first packet are negative when the capture is not time-ordered.
+    """
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        buf = np.frombuffer(mm, dtype=np.uint8)
+
+        ts = gather(buf, offsets, order + "u4") + ts_scale * gather(
+            buf, offsets + 4, order + "u4"
+        )
+        caplen = gather(buf, offsets + 8, order + "u4")
+
+        # IPv4 only (optionally behind one 802.1Q tag): sum the Total Length
+        # header field (bytes on the wire)
+        frame = offsets + RECORD_HDR
+        ethertype = gather(buf, frame + ETH_TYPE, ">u2")
+        vlan = ethertype == ETH_VLAN
+        l3 = frame + ETH_TYPE + 2 + np.where(vlan, 4, 0)
+        ethertype = np.where(vlan, gather(buf, l3 - 2, ">u2"), ethertype)
+        is_ip = (ethertype == ETH_IPV4) & (frame + caplen >= l3 + 4)
+        ip_len = gather(buf, l3 + 2, ">u2")
+        del buf
+
+    ts, ip_len = ts[is_ip], ip_len[is_ip]
+
+    # Time since the capture began -> bin index -> accumulated length in bytes
+    bin_idx = ((ts - first_ts) // bin_size).astype(np.int64)
+    if len(bin_idx) == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+    lo = int(bin_idx.min())
+    return lo, np.bincount(bin_idx - lo, weights=ip_len).astype(np.int64)
+
+
 def main() -> None:
     args = parse_args()
 
     if not args.pcap.exists():
         raise FileNotFoundError(args.pcap)
 
-    # Map bin index -> accumulated length in bytes
-    bins: dict[int, int] = defaultdict(int)
-    first_ts: float | None = None
-
-    with PcapReader(str(args.pcap)) as reader:
-        for pkt in reader:
-            # Establish zero point at first packet
-            if first_ts is None:
-                first_ts = pkt.time
-
-            # Time since the capture began
-            rel_time = pkt.time - first_ts
-            bin_idx = int(rel_time // args.bin_size)
-
-            # IPv4 only: sum the Total Length header field (bytes on the wire)
-            if IP in pkt:
-                bins[bin_idx] += int(pkt[IP].len)
+    # The record chain can only be walked sequentially; everything after
+    # that is independent per record, so it is split across processes
+    with args.pcap.open("rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        if mm[:4] == PCAPNG_MAGIC:
+            raise ValueError(
+                f"{args.pcap} is a pcapng file, convert it with editcap -F pcap"
+            )
+        if mm[:4] not in PCAP_MAGIC:
+            raise ValueError(f"{args.pcap} is not a pcap file")
+        order, ts_scale = PCAP_MAGIC[mm[:4]]
+        # the upper bits of the field may carry FCS information
+        linktype = struct.unpack_from(order + "I", mm, LINKTYPE)[0] & 0xFFFF
+        if linktype != LINKTYPE_ETHERNET:
+            raise ValueError(
+                f"{args.pcap} has link type {linktype}, only Ethernet is supported"
+            )
+        offsets = record_offsets(mm, order)
+        if len(offsets) == 0:
+            return
+        sec, frac = struct.unpack_from(order + "II", mm, int(offsets[0]))
+        first_ts = sec + ts_scale * frac
+        cuts = np.searchsorted(offsets, np.arange(CHUNK_BYTES, len(mm), CHUNK_BYTES))
+
+    chunks = [c for c in np.split(offsets, cuts) if len(c)]
+    work = functools.partial(
+        sum_chunk,
+        args.pcap,
+        order=order,
+        ts_scale=ts_scale,
+        first_ts=first_ts,
+        bin_size=args.bin_size,
+    )
+    if len(chunks) == 1 or args.jobs <= 1:
+        parts = list(map(work, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            parts = list(pool.map(work, chunks))
+
+    parts = [(first, p) for first, p in parts if len(p)]
+    if not parts:
+        return
+    lo = min(first for first, _ in parts)
+    bins = np.zeros(max(first + len(p) for first, p in parts) - lo, dtype=np.int64)
+    for first, p in parts:
+        bins[first - lo : first - lo + len(p)] += p
 
     # Pretty‑print results in ascending order of bins
-    for idx in sorted(bins):
-        start = idx * args.bin_size
+    for idx in np.flatnonzero(bins):
+        start = (idx + lo) * args.bin_size
         end = start + args.bin_size
         print(f"[{start:g}, {end:g}): {bins[idx]}")
 
@@ -0,0 +1,281 @@
+from amaranth import *
+from amaranth.lib.memory import Memory as memory
+from amaranth.utils import ceil_log2
+from transactron import *
+
+from mur.count.CountMinSketch import normalize_hash_params
+from mur.count.hash import HASH_KINDS
+
+__all__ = ["BlockedCountMinSketch"]
+
+
+class BlockedCountMinSketch(Elaboratable):
+    """
+    BlockedCountMinSketch is a CountMinSketch with the Caffeine
+    ``FrequencySketch`` memory layout. The first row hash selects one block,
+    a single wide memory word holding ``slots`` counters for every row, and
+    each row increments / reads the counter of its own lane chosen by the bits
+    of its own row hash just above the block index. Every operation is one
+    memory access instead of ``depth`` independent ones. It is a drop-in
+    replacement for CountMinSketch, including the ``prehashed`` interface used
+    by RollingCountMinSketch.
+
+    Attributes
+    ----------
+        depth (int): Number of rows (lanes of a block).
+        width (int): Number of blocks (must be a power of 2, at most 2**16).
+        counter_width (int): Number of bits in each counter.
+        input_data_width (int): Number of bits in each input data.
+        hash_params (list[tuple[int, int]] | None): List of tuples containing
+            hash coefficients (a, b) for each row. If None, default values are used.
+        slots (int): Counters per row in a block (power of 2). Every row hash
+            gives ``log2(width)`` bits of block index (used from row 0 only)
+            and the next ``log2(slots)`` bits of slot index, so the two must
+            fit in 16 bits.
+        hash_kind (str): Hash family used by every row (see ``HASH_KINDS``).
+        saturate (bool): Counters stick at 2**counter_width - 1 instead of
+            wrapping around to 0.
+        conservative_update (bool): An insert only bumps the lanes whose
+            counter equals the key's current minimum, so collisions inflate
+            the other lanes less. Estimates never drop below the true count.
+        prehashed (bool): If True there are no hash units and
+            ``insert``/``query_req`` take ``hashes``, the 16-bit row hashes
+            packed row 0 first, computed once by the caller.
+
+    Methods
+    -------
+        insert(data: int): Insert data into the sketch.
+            (``insert(hashes)`` if prehashed)
+        query_req(data: int): Request a query for the count of data.
+            (``query_req(hashes)`` if prehashed)
+        query_resp(): Get the count and valid flag from the last query.
+        clear(): Clear the sketch. Clearing takes at least width + 20 cycles.
+    """
+
+    def __init__(
+        self,
+        *,
+        depth: int,
+        width: int,
+        counter_width: int,
+        input_data_width: int,
+        hash_params: list[tuple[int, int]] | None = None,
+        slots: int = 4,
+        hash_kind: str = "mod65521",
+        prehashed: bool = False,
+        saturate: bool = True,
+        conservative_update: bool = False,
+    ) -> None:
+        if depth < 1:
+            raise ValueError("depth must be ≥ 1")
+        if width & (width - 1) != 0 or not 1 < width <= 1 << 16:
+            raise ValueError(f"width must be a power of 2 up to 2**16, got {width}")
+        if slots < 1 or slots & (slots - 1) != 0:
+            raise ValueError(f"slots must be a power of 2, got {slots}")
+        if ceil_log2(width) + ceil_log2(slots) > 16:
+            raise ValueError(
+                f"a 16-bit row hash cannot index {width} blocks and {slots} slots"
+            )
+        if hash_kind not in HASH_KINDS:
+            raise ValueError(
+                f"hash_kind must be one of {sorted(HASH_KINDS)}, got {hash_kind!r}"
+            )
+
+        self.depth = depth
+        self.width = width
+        self.counter_width = counter_width
+        self.input_data_width = input_data_width
+        self.slots = slots
+        self.prehashed = prehashed
+        self.saturate = saturate
+        self.conservative_update = conservative_update
+        self.hash_params = normalize_hash_params(depth, hash_params)
+
+        self._arg, self._arg_width = (
+            ("hashes", 16 * depth) if prehashed else ("data", input_data_width)
+        )
+        self.insert = Method(i=[(self._arg, self._arg_width)])
+        self.query_req = Method(i=[(self._arg, self._arg_width)])
+        self.query_resp = Method(o=[("count", counter_width), ("valid", 1)])
+        self.clear = Method()
+
+        self._insert_hashes = []
+        self._query_hashes = []
+        if not prehashed:
+            hash_cls = HASH_KINDS[hash_kind]
+            for a, b in self.hash_params:
+                self._insert_hashes.append(
+                    hash_cls(input_width=input_data_width, a=a, b=b)
+                )
+                self._query_hashes.append(
+                    hash_cls(input_width=input_data_width, a=a, b=b)
+                )
+
+        self._mem = memory(shape=depth * slots * counter_width, depth=width, init=[])
+        self._wr = self._mem.write_port(domain="sync")
+        self._rd_insert = self._mem.read_port(domain="sync", transparent_for=[self._wr])
+        self._rd_query = self._mem.read_port(domain="sync", transparent_for=[self._wr])
+
+    def _lane_slots(self, hashes: Value) -> list[Value]:
+        """Slot index of every lane, from its row hash above the block index."""
+        bits = ceil_log2(self.slots)
+        if bits == 0:
+            return [C(0, 1)] * self.depth
+        lo = ceil_log2(self.width)
+        return [hashes.word_select(i, 16)[lo : lo + bits] for i in range(self.depth)]
+
+    def _counter(self, word: Value, lane: int, slot: int) -> Value:
+        return word.word_select(lane * self.slots + slot, self.counter_width)
+
+    def _selected(self, word: Value, slots: list[Signal]) -> list[Value]:
+        """The counter each lane's slot index points at."""
+        return [
+            Array(self._counter(word, lane, slot) for slot in range(self.slots))[
+                slots[lane]
+            ]
+            for lane in range(self.depth)
+        ]
+
+    @staticmethod
+    def _min(values: list[Value]) -> Value:
+        """Balanced tree of 2-input minimums."""
+        while len(values) > 1:
+            pairs = zip(values[0::2], values[1::2])
+            values = [Mux(a < b, a, b) for a, b in pairs] + values[len(values) & ~1 :]
+        return values[0]
+
+    def elaborate(self, platform):
+        m = TModule()
+        m.submodules.mem = self._mem
+        m.submodules += [*self._insert_hashes, *self._query_hashes]
+
+        addr_bits = ceil_log2(self.width)
+
+        # row hashes of this cycle's insert and query
+        insert_hashes = Signal(16 * self.depth)
+        insert_valid = Signal()
+        query_hashes = Signal(16 * self.depth)
+        query_valid = Signal()
+        if self.prehashed:
+
+            @def_method(m, self.insert)
+            def _(hashes):
+                m.d.comb += [insert_hashes.eq(hashes), insert_valid.eq(1)]
+
+            @def_method(m, self.query_req)
+            def _(hashes):
+                m.d.comb += [query_hashes.eq(hashes), query_valid.eq(1)]
+
+        else:
+            for units, hashes, valid in (
+                (self._insert_hashes, insert_hashes, insert_valid),
+                (self._query_hashes, query_hashes, query_valid),
+            ):
+                with Transaction().body(m):
+                    results = [h.result(m) for h in units]
+                    m.d.comb += [
+                        hashes.eq(Cat(r["hash"] for r in results)),
+                        valid.eq(results[0]["valid"]),
+                    ]
+
+            @def_method(m, self.insert)
+            def _(data):
+                for h in self._insert_hashes:
+                    h.input(m, data=data)
+
+            @def_method(m, self.query_req)
+            def _(data):
+                for h in self._query_hashes:
+                    h.input(m, data=data)
+
+        # Stage A: read the block; the read ports are transparent to the
+        # write port, so a block written in this cycle is read back updated
+        m.d.comb += [
+            self._rd_insert.addr.eq(insert_hashes[:addr_bits]),
+            self._rd_query.addr.eq(query_hashes[:addr_bits]),
+        ]
+        ins_valid = Signal()
+        ins_addr = Signal(addr_bits)
+        ins_slots = [Signal(range(self.slots)) for _ in range(self.depth)]
+        q_valid = Signal()
+        q_slots = [Signal(range(self.slots)) for _ in range(self.depth)]
+        m.d.sync += [
+            ins_valid.eq(insert_valid),
+            ins_addr.eq(insert_hashes[:addr_bits]),
+            q_valid.eq(query_valid),
+        ]
+        for reg, slot in zip(ins_slots, self._lane_slots(insert_hashes)):
+            m.d.sync += reg.eq(slot)
+        for reg, slot in zip(q_slots, self._lane_slots(query_hashes)):
+            m.d.sync += reg.eq(slot)
+
+        # Stage B (insert): bump the selected slot of every lane, write back
+        word = self._rd_insert.data
+        limit = (1 << self.counter_width) - 1
+        counters = [
+            (lane, slot) for lane in range(self.depth) for slot in range(self.slots)
+        ]
+
+        if self.conservative_update:
+            ins_selected = self._selected(word, ins_slots)
+            ins_min = self._min(ins_selected)
+
+        def hit(lane: int, slot: int) -> Value:
+            bump = ins_slots[lane] == slot
+            if self.conservative_update:
+                bump &= ins_selected[lane] == ins_min
+            if self.saturate:
+                bump &= self._counter(word, lane, slot) != limit
+            return bump
+
+        if self.saturate:
+            # a bumped counter is below its limit and cannot carry into the
+            # next one: one add of a 1-per-bumped-counter mask (SWAR)
+            mask = Cat(Cat(hit(*c), C(0, self.counter_width - 1)) for c in counters)
+            bumped = (word + mask)[: len(word)]
+        else:
+            bumped = Cat(
+                (self._counter(word, *c) + hit(*c))[: self.counter_width]
+                for c in counters
+            )
+        m.d.comb += [
+            self._wr.addr.eq(ins_addr),
+            self._wr.data.eq(bumped),
+            self._wr.en.eq(ins_valid),
+        ]
+
+        # Stage B (query): minimum over the selected slot of every lane
+        q_min = self._min(self._selected(self._rd_query.data, q_slots))
+        resp_count = Signal(self.counter_width)
+        resp_valid = Signal()
+        m.d.sync += resp_valid.eq(q_valid)
+        with m.If(q_valid):
+            m.d.sync += resp_count.eq(q_min)
+
+        @def_method(m, self.query_resp)
+        def _():
+            return {"count": resp_count, "valid": resp_valid}
+
+        # Clear: let in-flight operations drain, then sweep every block
+        clr_waiting = Signal(range(21))
+        clr_running = Signal()
+        clr_addr = Signal(addr_bits)
+        with m.If(clr_waiting > 0):
+            m.d.sync += clr_waiting.eq(clr_waiting - 1)
+            with m.If(clr_waiting == 1):
+                m.d.sync += [clr_running.eq(1), clr_addr.eq(0)]
+        with m.If(clr_running):
+            m.d.comb += [
+                self._wr.addr.eq(clr_addr),
+                self._wr.data.eq(0),
+                self._wr.en.eq(1),
+            ]
+            m.d.sync += clr_addr.eq(clr_addr + 1)
+            with m.If(clr_addr == self.width - 1):
+                m.d.sync += clr_running.eq(0)
+
+        @def_method(m, self.clear)
+        def _():
+            m.d.sync += clr_waiting.eq(20)
+
+        return m
@@ -12,28 +12,54 @@ from mur.count.VolCounter import VolCounter
 # log = logging.HardwareLogger("cmsvolcontroller")
 __all__ = ["CMSVolController"]
 
+_TAG_WIDTH = 2
+_CHANNELS = 3
+
 
 class CMSVolController(Elaboratable):
     """
     CMSVolController is a controller that manages the interaction between
-    multiple CountMinSketch instances and a volume counter. It allows for
-    inserting data into the sketches, querying the counts, and managing
-    the volume counter. The controller uses a FIFO to manage the data flow
-    and a rolling count-min sketch to maintain the counts.
+    a rolling count-min sketch and a volume counter. It allows for
+    inserting data into the sketch, querying the counts, and managing
+    the volume counter. The controller uses a FIFO to manage the data flow.
+
+    The three per-packet keys (src IP + dst IP, dst port + dst IP and
+    src IP + length) share one sketch: they are fed on three consecutive
+    cycles, each prefixed with a 2-bit channel tag so their keyspaces stay
+    disjoint, and the three query responses are summed before the decision.
+    A packet therefore occupies the sketch input for three cycles.
 
     Attributes
     ----------
         depth (int): Number of hash tables (rows) in the sketch.
-        width (int): The size of CountHashTab (number of hash buckets).
-        counter_width (int): Number of bits in each counter.
+        width (int): The size of CountHashTab (number of hash buckets). With
+            ``blocked`` it is still the number of counters per row, packed
+            ``slots`` to a block, so both layouts use the same memory.
+        counter_width (int): Number of bits in each counter. Counters
+            saturate, so they only need to reach past discard_threshold.
         hash_params (list[tuple[int, int]] | None): List of tuples containing
             hash coefficients (a, b) for each row. If None, default values are used.
+        hash_kind (str): Hash family used by the sketch rows (see ``HASH_KINDS``).
+        log_block_size (int): log2 of the memory depth of a sketch row.
+            A whole word is wiped per cycle, so a role change clears a sketch
+            in about 2**log_block_size + 20 cycles.
+        gen_bits (int): Generation stamp width of the sketch rows. A role
+            change then bumps the generation instead of sweeping, except
+            once every 2**gen_bits changes (not with ``blocked``).
+        blocked (bool): Keep all rows of a bucket in one wide memory word
+            (BlockedCountMinSketch), so every insert and query is a single
+            memory access with a parallel min over the rows.
+        slots (int): Counters per row in a block when ``blocked``.
+        conservative_update (bool): Only bump the rows at the key's minimum
+            on insert (requires ``blocked``).
         discard_threshold (int): If the sum of the counts is lower than this threshold,
             then the corresponding packet values have not been seen in the window before
             so the packet is discarded.
         window (int): The size of the sliding window for the volume counter.
         volume_threshold (int): The threshold for the volume counter.
         fifo_depth (int): The depth of the FIFO used for data flow management.
+            It also bounds the query packets awaiting output, so new packets
+            wait while that many decisions are undelivered.
 
     Methods
     -------
@@ -49,24 +75,34 @@ class CMSVolController(Elaboratable):
         *,
         depth: int = 4,
         width: int = 32,
-        counter_width: int = 32,
+        counter_width: int = 16,
         hash_params: list[tuple[int, int]] | None = None,
         discard_threshold: int = 0,
         window: int = 1024,
         volume_threshold: int = 10_000,
         fifo_depth: int = 16,
+        hash_kind: str = "mod65521",
+        log_block_size: int = 11,
+        blocked: bool = False,
+        slots: int = 4,
+        conservative_update: bool = False,
+        gen_bits: int = 0,
     ) -> None:
 
         self.discover_threshold = discard_threshold
         lay32 = [("data", 32)]
         lay16 = [("data", 16)]
         lay5 = [("data", 5)]
+        lay1 = [("data", 1)]
 
         self._fifo_sip = BasicFifo(lay32, fifo_depth)
         self._fifo_dip = BasicFifo(lay32, fifo_depth)
         self._fifo_dport = BasicFifo(lay16, fifo_depth)
         self._fifo_len = BasicFifo(lay16, fifo_depth)
         self._fifo_out = BasicFifo(lay5, fifo_depth)
+        # finished query decisions waiting for their turn in the out FIFO
+        self._fifo_dec = BasicFifo(lay1, fifo_depth)
+        self.fifo_depth = fifo_depth
         self.out = self._fifo_out.read
 
         self.push_a = self._fifo_sip.write
@@ -74,31 +110,25 @@ class CMSVolController(Elaboratable):
         self.push_c = self._fifo_dport.write
         self.push_s = self._fifo_len.write
 
-        self._insert_requested = Signal(32)
-        self._query_requested = Signal(32)
-        self._insert_received = Signal(32)
-        self._query_received = Signal(32)
+        # packets inserted since the last emission (emitted as a 5-bit count)
+        self._outstanding_inserts = Signal(5)
+        # query packets whose decision has not been written out yet;
+        # never more than fifo_depth, so _fifo_dec cannot overflow
+        self._outstanding_queries = Signal(range(fifo_depth + 1))
 
-        self.rcms_sipdip = RollingCountMinSketch(
-            depth=depth,
-            width=width,
-            counter_width=counter_width,
-            input_data_width=32 + 32,
-            hash_params=hash_params,
-        )
-        self.rcms_dportdip = RollingCountMinSketch(
+        self.rcms = RollingCountMinSketch(
             depth=depth,
-            width=width,
+            # a block holds `slots` counters of every row
+            width=width // slots if blocked else width,
             counter_width=counter_width,
-            input_data_width=16 + 32,
-            hash_params=hash_params,
-        )
-        self.rcms_siplen = RollingCountMinSketch(
-            depth=depth,
-            width=width,
-            counter_width=counter_width,
-            input_data_width=32 + 16,
+            input_data_width=_TAG_WIDTH + 64,
             hash_params=hash_params,
+            hash_kind=hash_kind,
+            log_block_size=log_block_size,
+            blocked=blocked,
+            slots=slots,
+            conservative_update=conservative_update,
+            gen_bits=gen_bits,
         )
         self.vcnt = VolCounter(
             window=window,
@@ -115,13 +145,11 @@ class CMSVolController(Elaboratable):
             self._fifo_dport,
             self._fifo_len,
             self._fifo_out,
+            self._fifo_dec,
             self.vcnt,
-            self.rcms_sipdip,
-            self.rcms_dportdip,
-            self.rcms_siplen,
+            self.rcms,
         ]
 
-        self._current_mode = Signal(1)
         # signal for queue reads
         sip = Signal(32)
         sip_v = Signal(1)
@@ -133,86 +161,128 @@ class CMSVolController(Elaboratable):
         s_v = Signal(1)
         all_v = Signal(1)
         m.d.comb += all_v.eq(sip_v & dip_v & dport_v & s_v)
-        with Transaction().body(m, request=all_v):
-            self._current_mode = self.rcms_sipdip.input(m, data=Cat(sip, dip))["mode"]
-            self.rcms_dportdip.input(m, data=Cat(dport, dip))
-            self.rcms_siplen.input(m, data=Cat(sip, s))
-            with m.If(self._current_mode == 0):
-                m.d.sync += self._insert_requested.eq(self._insert_requested + 1)
+
+        # channel of the key fed into the sketch in this cycle
+        ch = Signal(range(_CHANNELS))
+        key = Signal(64)
+        with m.Switch(ch):
+            with m.Case(0):
+                m.d.comb += key.eq(Cat(sip, dip))
+            with m.Case(1):
+                m.d.comb += key.eq(Cat(dport, dip))
+            with m.Case(2):
+                m.d.comb += key.eq(Cat(sip, s))
+        last_ch = Signal(1)
+        m.d.comb += last_ch.eq(ch == _CHANNELS - 1)
+
+        # window end latched until the next packet boundary, so that all
+        # three keys of a packet see the same mode and the same sketch
+        pending = Signal(1)
+        pending_mode = Signal(1)
+        apply_now = Signal(1)
+        m.d.comb += apply_now.eq(pending & (ch == 0))
+
+        insert_issued = Signal(1)
+        query_issued = Signal(1)
+        insert_retired = Signal(1)
+        query_retired = Signal(1)
+
+        # a new packet only starts while its decision is sure to fit in
+        # _fifo_dec, however long out() stays unread
+        room = Signal(1)
+        m.d.comb += room.eq(self._outstanding_queries != self.fifo_depth)
+
+        with Transaction().body(m, request=all_v & ~apply_now & (room | (ch != 0))):
+            mode = self.rcms.input(m, data=Cat(ch, key))["mode"]
+            with m.If(last_ch):
+                m.d.sync += ch.eq(0)
+                with m.If(mode == 0):
+                    m.d.comb += insert_issued.eq(1)
+                with m.Else():
+                    m.d.comb += query_issued.eq(1)
+                self.vcnt.add_sample(m, data=s)
+                m.d.sync += [
+                    sip_v.eq(0),
+                    dip_v.eq(0),
+                    dport_v.eq(0),
+                    s_v.eq(0),
+                ]
             with m.Else():
-                m.d.sync += self._query_requested.eq(self._query_requested + 1)
-            self.vcnt.add_sample(m, data=s)
-            m.d.sync += [
-                sip_v.eq(0),
-                dip_v.eq(0),
-                dport_v.eq(0),
-                s_v.eq(0),
-            ]
-
-        with Transaction().body(m, request=all_v | ~sip_v):
+                m.d.sync += ch.eq(ch + 1)
+
+        consume = Signal(1)
+        m.d.comb += consume.eq(all_v & last_ch)
+        with Transaction().body(m, request=consume | ~sip_v):
             m.d.sync += sip.eq(self._fifo_sip.read(m)["data"])
             m.d.sync += sip_v.eq(1)
-        with Transaction().body(m, request=all_v | ~dip_v):
+        with Transaction().body(m, request=consume | ~dip_v):
             m.d.sync += dip.eq(self._fifo_dip.read(m)["data"])
             m.d.sync += dip_v.eq(1)
-        with Transaction().body(m, request=all_v | ~dport_v):
+        with Transaction().body(m, request=consume | ~dport_v):
             m.d.sync += dport.eq(self._fifo_dport.read(m)["data"])
             m.d.sync += dport_v.eq(1)
-        with Transaction().body(m, request=all_v | ~s_v):
+        with Transaction().body(m, request=consume | ~s_v):
             m.d.sync += s.eq(self._fifo_len.read(m)["data"])
             m.d.sync += s_v.eq(1)
 
+        with Transaction().body(m, request=apply_now):
+            self.rcms.set_mode(m, mode=pending_mode)
+            self.rcms.change_roles(m, enable=pending_mode == 0)
+            m.d.sync += pending.eq(0)
+
+        # declared after the apply transaction so a result arriving in the
+        # same cycle is kept pending instead of being cleared
         with Transaction().body(m):
             res = self.vcnt.result(m)
-            self.rcms_sipdip.set_mode(m, mode=res["mode"])
-            self.rcms_dportdip.set_mode(m, mode=res["mode"])
-            self.rcms_siplen.set_mode(m, mode=res["mode"])
-            with m.If(res["mode"] == 0):
-                self.rcms_sipdip.change_roles(m)
-                self.rcms_dportdip.change_roles(m)
-                self.rcms_siplen.change_roles(m)
-
-        self._inserts_difference = Signal(5)
-        m.d.comb += self._inserts_difference.eq(
-            self._insert_requested - self._insert_received
-        )
+            m.d.sync += [pending.eq(1), pending_mode.eq(res["mode"])]
+
+        # an emission hands out every insert counted so far
+        m.d.sync += [
+            self._outstanding_inserts.eq(
+                Mux(
+                    insert_retired,
+                    insert_issued,
+                    self._outstanding_inserts + insert_issued,
+                )
+            ),
+            self._outstanding_queries.eq(
+                self._outstanding_queries + query_issued - query_retired
+            ),
+        ]
         self._all_query_received = Signal(1)
-        m.d.comb += self._all_query_received.eq(
-            self._query_requested == self._query_received
-        )
-        self._query_decision = Signal(32)
-        self._out = Signal(5)
-        self._out_valid = Signal(1)
-        self._out_valid2 = Signal(1)
-        q1_data = Signal(32)
-        q2_data = Signal(32)
-        q3_data = Signal(32)
-        q_sum = Signal(32)
-
-        q_valid = Signal(1)
-        m.d.sync += self._out_valid.eq(q_valid)
-        m.d.sync += self._out_valid2.eq(self._out_valid)
+        m.d.comb += self._all_query_received.eq(self._outstanding_queries == 0)
+        q_ch = Signal(range(_CHANNELS))
+        # three counts never overflow counter_width + 2 bits
+        sum_width = self.rcms.counter_width + 2
+        q_acc = Signal(sum_width)
+
+        # Priority: pending query decisions first, then the number of
+        # packets inserted since the last emission
+        with Transaction().body(m, request=~self._all_query_received):
+            hit = self._fifo_dec.read(m)["data"]
+            self._fifo_out.write(m, {"data": hit})
+            m.d.comb += query_retired.eq(1)
+
+        with Transaction().body(
+            m,
+            request=self._all_query_received & (self._outstanding_inserts != 0),
+        ):
+            self._fifo_out.write(m, {"data": self._outstanding_inserts})
+            m.d.comb += insert_retired.eq(1)
+
         with Transaction().body(m):
-            q = self.rcms_sipdip.output(m)
-            m.d.sync += q1_data.eq(q["count"])
-            m.d.sync += q2_data.eq(self.rcms_dportdip.output(m)["count"])
-            m.d.sync += q3_data.eq(self.rcms_siplen.output(m)["count"])
-            m.d.sync += q_valid.eq(q["valid"])
-            # log.debug(m, q["valid"], "{:x}", q1_data | q2_data | q3_data)
-
-        with m.If(q_valid):
-            m.d.sync += q_sum.eq(q1_data + q2_data + q3_data)
-
-        with m.If(self._all_query_received & self._inserts_difference):
-            m.d.sync += self._out.eq(self._inserts_difference)
-            m.d.sync += self._insert_received.eq(self._insert_requested)
-            m.d.sync += self._out_valid2.eq(1)
-        with m.If(~self._all_query_received & self._out_valid):
-            m.d.sync += self._out_valid2.eq(1)
-            m.d.sync += self._query_received.eq(self._query_received + 1)
-            m.d.sync += self._out.eq(q_sum > self.discover_threshold)
-
-        with Transaction().body(m, request=self._out_valid2):
-            self._fifo_out.write(m, {"data": self._out})
+            q = self.rcms.output(m)
+            # responses come back in channel order; sum every three of them
+            with m.If(q["valid"]):
+                with m.If(q_ch == _CHANNELS - 1):
+                    m.d.sync += [q_ch.eq(0), q_acc.eq(0)]
+                    self._fifo_dec.write(
+                        m, {"data": q_acc + q["count"] > self.discover_threshold}
+                    )
+                with m.Else():
+                    m.d.sync += [
+                        q_ch.eq(q_ch + 1),
+                        q_acc.eq(q_acc + q["count"]),
+                    ]
 
         return m
@@ -2,7 +2,8 @@
 from amaranth import *
 from transactron import *
 from amaranth.lib.memory import Memory as memory
-from mur.count.hash import Hash
+from amaranth.utils import ceil_log2, exact_log2
+from mur.count.hash import HASH_KINDS
 
 __all__ = ["CountHashTab"]
 
@@ -10,21 +11,47 @@ __all__ = ["CountHashTab"]
 class CountHashTab(Elaboratable):
     """
     CountHashTab is a single row in a CountMinSketch data structure.
+    Inserts and queries read the counters through separate memory ports, so
+    both methods can be called in every cycle, including the same one.
 
     Attributes
     ----------
         size (int): Number of hash buckets (must be a power of 2)
         counter_width (int): Number of bits in each counter
         input_data_width (int): Number of bits in each input data
+        log_block_size (int): log2 of the memory depth (capped at log2(size)).
+            The size // 2**log_block_size counters sharing an address are
+            packed into one memory word, each with its own write enable.
         hash_a (int): First hash coefficient
         hash_b (int): Second hash coefficient
+        hash_kind (str): Hash family, a key of ``HASH_KINDS``
+            ("mod65521" universal hash by default, "xorfold65521", "fmix32",
+            "multiply_shift", "tabulation", "mersenne31" or "crc16")
+        saturate (bool): Counters stick at 2**counter_width - 1 instead of
+            wrapping around to 0
+        gen_bits (int): Width of the generation stamp stored next to every
+            counter. A counter whose stamp differs from the current
+            generation reads as 0, so ``clear`` only bumps the generation and
+            sweeps the memory once every 2**gen_bits clears. 0 sweeps on
+            every clear.
+        prehashed (bool): If True the row has no hash units of its own and
+            ``insert``/``query_req`` take the 16-bit row hash instead of the
+            data, so one hash pipeline can be shared by several tables.
 
     Methods
     -------
         insert(data: int): Insert data into the hash table
+            (``insert(hash)`` if prehashed)
         query_req(data: int): Request a query for the count of data
+            (``query_req(hash)`` if prehashed)
         query_resp(): Get the count and valid flag from the last query
-        clear(): Clear the hash table. Clearing takes at lest self.size + 2 cycles.
+        insert_query(data: int): Insert data and answer it through
+            ``query_resp`` with the incremented count, in one pass over the
+            memory (``insert_query(hash)`` if prehashed). Cannot share a
+            cycle with ``insert`` or ``query_req``.
+        clear(): Clear the hash table. A whole memory word is wiped per cycle,
+            so clearing takes at least 2**log_block_size + 20 cycles (21
+            cycles when gen_bits > 0 and the generation does not wrap).
     """
 
     _P = 65521
@@ -38,50 +65,86 @@ class CountHashTab(Elaboratable):
         log_block_size: int = 11,
         hash_a: int = 1,
         hash_b: int = 0,
+        hash_kind: str = "mod65521",
+        prehashed: bool = False,
+        saturate: bool = True,
+        gen_bits: int = 0,
     ):
 
         if size & (size - 1) != 0:
             raise ValueError(f"size must be a power of 2, got {size}")
+        if size > 1 << 16:
+            raise ValueError(f"size must be at most 2**16 (16-bit hash), got {size}")
         if not counter_width in (8, 16, 32):
             raise ValueError(
                 f"counter_width must be 8, 16, or 32 bits, got {counter_width}"
             )
+        if hash_kind not in HASH_KINDS:
+            raise ValueError(
+                f"hash_kind must be one of {sorted(HASH_KINDS)}, got {hash_kind!r}"
+            )
+        if gen_bits < 0:
+            raise ValueError(f"gen_bits must be ≥ 0, got {gen_bits}")
         self.size = size
         self.counter_width = counter_width
         self.input_data_width = input_data_width
 
-        self.insert = Method(i=[("data", input_data_width)])
-        self.query_req = Method(i=[("data", input_data_width)])
+        self.prehashed = prehashed
+        self.saturate = saturate
+        self.gen_bits = gen_bits
+        # a memory lane: the counter, then its generation stamp
+        self.entry_width = counter_width + gen_bits
+        in_layout = [("hash", 16)] if prehashed else [("data", input_data_width)]
+        self.insert = Method(i=in_layout)
+        self.query_req = Method(i=in_layout)
         self.query_resp = Method(o=[("count", counter_width), ("valid", 1)])
+        self.insert_query = Method(i=in_layout)
         self.clear = Method()
-
-        self.insert_hash = Hash(input_width=input_data_width, a=hash_a, b=hash_b)
-        self.query_hash = Hash(input_width=input_data_width, a=hash_a, b=hash_b)
-        self.hash_a = Signal(32, init=hash_a % self._P)
-        self.hash_b = Signal(32, init=hash_b % self._P)
-
-        self.log_block_size = log_block_size
-        self._memoryblocks: list[memory] = []
-        self._write_ports = []
-        self._read_ports = []
-        for i in range(size // (1 << self.log_block_size)):
-            self._block = memory(
-                shape=counter_width,
-                depth=(1 << self.log_block_size),
-                init=[0] * (1 << self.log_block_size),
+        # an insert_query uses the insert path and answers in a query's slot
+        self.insert_query.add_conflict(self.insert)
+        self.insert_query.add_conflict(self.query_req)
+
+        self.hash_kind = hash_kind
+        self._hashes = []
+        if not prehashed:
+            hash_cls = HASH_KINDS[hash_kind]
+            self.insert_hash = hash_cls(
+                input_width=input_data_width, a=hash_a, b=hash_b
             )
-            setattr(self, f"_block_{i}", self._block)
-            self._memoryblocks.append(self._block)
-            wr = self._block.write_port(domain="sync")
-            rd = self._block.read_port(domain="sync", transparent_for=[wr])
-            setattr(self, f"_wr_{i}", wr)
-            setattr(self, f"_rd_{i}", rd)
-            self._write_ports.append(wr)
-            self._read_ports.append(rd)
+            self.query_hash = hash_cls(input_width=input_data_width, a=hash_a, b=hash_b)
+            self._hashes = [self.insert_hash, self.query_hash]
+        self.hash_a = hash_a % self._P
+        self.hash_b = hash_b % self._P
+
+        # a table smaller than one block is a single, smaller block
+        self.index_bits = exact_log2(size)
+        self.log_block_size = min(log_block_size, self.index_bits)
+        # one wide memory: lane i of the word at address x is the counter of
+        # bucket i * 2**log_block_size + x, written through its own enable
+        self.lanes = size >> self.log_block_size
+        self._mem = memory(
+            shape=self.lanes * self.entry_width,
+            depth=(1 << self.log_block_size),
+            init=[],
+        )
+        # inserts and queries read through their own ports, so one of each
+        # can be issued in the same cycle
+        self._wr = self._mem.write_port(domain="sync", granularity=self.entry_width)
+        self._rd_insert = self._mem.read_port(domain="sync", transparent_for=[self._wr])
+        self._rd_query = self._mem.read_port(domain="sync", transparent_for=[self._wr])
+
+    def _increment(self, value: Value) -> Value:
+        """``value + 1`` in counter_width bits, sticking at the maximum if
+        saturating. The limit test is an AND-reduce of the counter, not a
+        compare against a carry-out."""
+        bumped = (value + 1)[: self.counter_width]
+        if not self.saturate:
+            return bumped
+        return Mux(value.all(), value, bumped)
 
     def elaborate(self, platform):
         m = TModule()
-        m.submodules += [self._memoryblocks, self.insert_hash, self.query_hash]
+        m.submodules += [self._mem, *self._hashes]
 
         req_start = Signal()
         req_save = Signal()
@@ -91,26 +154,37 @@ class CountHashTab(Elaboratable):
         req_adress_before_before = Signal(self.log_block_size)
         req_add_inc = Signal()
         req_final_answer_ready = Signal()
-        mem_idx_before = Signal(range(len(self._memoryblocks)))
-        mem_idx = Signal(range(len(self._memoryblocks)))
-        mem_idx_next = Signal(range(len(self._memoryblocks)))
-        read_mult = [Signal() for _ in range(len(self._read_ports))]
-        read_mult_before = [Signal() for _ in range(len(self._read_ports))]
-
-        req_read_value = [
-            Signal(self.counter_width) for _ in range(len(self._read_ports))
-        ]
+        mem_idx = Signal(range(self.lanes))
+        mem_idx_next = Signal(range(self.lanes))
+        read_mult = [Signal() for _ in range(self.lanes)]
+        req_read_value = [Signal(self.counter_width) for _ in range(self.lanes)]
+
+        ins_idx = Signal(range(self.lanes))
+        ins_idx_next = Signal(range(self.lanes))
+        ins_mult = [Signal() for _ in range(self.lanes)]
+        ins_read_value = [Signal(self.counter_width) for _ in range(self.lanes)]
 
         inc_start = Signal()
         insert_incrementing = Signal()
         insert_writing = Signal()
+        # the same ladder for inserts that also answer (insert_query)
+        fused_start = Signal()
+        fused_incrementing = Signal()
+        fused_writing = Signal()
+        fused_written = Signal()
         clr_addr = Signal(self.log_block_size)
         clr_running = Signal()
         clr_waiting = Signal(range(64))
+        gen = Signal(self.gen_bits)
 
-        for wr, rd in zip(self._write_ports, self._read_ports):
-            m.d.comb += rd.en.eq(1)
-            m.d.sync += wr.en.eq(0)
+        def count_of(word: Value, lane: int) -> Value:
+            """Counter of a lane, 0 if stamped with an older generation."""
+            entry = word.word_select(lane, self.entry_width)
+            count = entry[: self.counter_width]
+            return Mux(entry[self.counter_width :] == gen, count, 0)
+
+        m.d.comb += [self._rd_insert.en.eq(1), self._rd_query.en.eq(1)]
+        m.d.sync += self._wr.en.eq(0)
 
         m.d.sync += [
             req_start.eq(0),
@@ -121,33 +195,103 @@ class CountHashTab(Elaboratable):
             inc_start.eq(0),
             insert_incrementing.eq(inc_start),
             insert_writing.eq(insert_incrementing),
+            fused_start.eq(0),
+            fused_incrementing.eq(fused_start),
+            fused_writing.eq(fused_incrementing),
+            fused_written.eq(fused_writing),
         ]
 
-        m.d.sync += mem_idx.eq(mem_idx_next)
-        m.d.sync += mem_idx_before.eq(mem_idx)
+        m.d.sync += [mem_idx.eq(mem_idx_next), ins_idx.eq(ins_idx_next)]
         m.d.sync += [
             req_adress_before.eq(req_address),
             req_adress_before_before.eq(req_adress_before),
         ]
-        address_mask = (1 << self.log_block_size) - 1
-
-        with Transaction().body(m):
-            res = self.query_hash.result(m)
-            m.d.sync += req_address.eq(res["hash"] & address_mask)
-            with m.If(res["valid"]):
-                for i, rd in enumerate(self._read_ports):
-                    m.d.sync += rd.addr.eq(res["hash"] & address_mask)
-                m.d.sync += [
-                    req_start.eq(1),
-                    mem_idx_next.eq((res["hash"] >> self.log_block_size)),
+
+        # bucket = low index_bits of the hash: the low log_block_size bits
+        # address a block, the bits above select it
+        def block_addr(hash: Value) -> Value:
+            return hash[: self.log_block_size]
+
+        def block_idx(hash: Value) -> Value:
+            return hash[self.log_block_size : self.index_bits]
+
+        # row hashes of this cycle's query and insert, from the own hash
+        # units or straight from the prehashed methods
+        query_hash = Signal(16)
+        query_valid = Signal()
+        insert_hash = Signal(16)
+        insert_valid = Signal()
+        insert_fused = Signal()
+        if self.prehashed:
+
+            @def_method(m, self.insert)
+            def _(hash):
+                m.d.comb += [insert_hash.eq(hash), insert_valid.eq(1)]
+
+            @def_method(m, self.insert_query)
+            def _(hash):
+                m.d.comb += [
+                    insert_hash.eq(hash),
+                    insert_valid.eq(1),
+                    insert_fused.eq(1),
                 ]
 
-        for i, (rmul, rmulb) in enumerate(zip(read_mult, read_mult_before)):
-            m.d.sync += rmul.eq(mem_idx == i)
-            m.d.sync += rmulb.eq(rmul)
+            @def_method(m, self.query_req)
+            def _(hash):
+                m.d.comb += [query_hash.eq(hash), query_valid.eq(1)]
+
+        else:
+            with Transaction().body(m):
+                res = self.query_hash.result(m)
+                m.d.comb += [query_hash.eq(res["hash"]), query_valid.eq(res["valid"])]
+            with Transaction().body(m):
+                res = self.insert_hash.result(m)
+                m.d.comb += [
+                    insert_hash.eq(res["hash"]),
+                    insert_valid.eq(res["valid"]),
+                ]
 
-        for req_read, rd in zip(req_read_value, self._read_ports):
-            m.d.sync += req_read.eq(rd.data)
+            # whether each insert inside the hash pipeline answers, oldest
+            # at fused_rd; an insert leaves the pipeline after `latency`
+            # cycles, so a ring of more than `latency` entries never
+            # overwrites a live one
+            ring = 1 << ceil_log2(self.insert_hash.latency + 1)
+            fused_ring = Array(Signal(name=f"fused{i}") for i in range(ring))
+            fused_wr = Signal(range(ring))
+            fused_rd = Signal(range(ring))
+            with m.If(insert_valid):
+                m.d.comb += insert_fused.eq(fused_ring[fused_rd])
+                m.d.sync += fused_rd.eq(fused_rd + 1)
+
+            @def_method(m, self.insert)
+            def _(data):
+                self.insert_hash.input(m, data)
+                m.d.sync += [fused_ring[fused_wr].eq(0), fused_wr.eq(fused_wr + 1)]
+
+            @def_method(m, self.insert_query)
+            def _(data):
+                self.insert_hash.input(m, data)
+                m.d.sync += [fused_ring[fused_wr].eq(1), fused_wr.eq(fused_wr + 1)]
+
+            @def_method(m, self.query_req)
+            def _(data):
+                self.query_hash.input(m, data)
+
+        m.d.sync += req_address.eq(block_addr(query_hash))
+        with m.If(query_valid):
+            m.d.sync += self._rd_query.addr.eq(block_addr(query_hash))
+            m.d.sync += [
+                req_start.eq(1),
+                mem_idx_next.eq(block_idx(query_hash)),
+            ]
+
+        for i in range(self.lanes):
+            m.d.sync += [
+                read_mult[i].eq(mem_idx == i),
+                ins_mult[i].eq(ins_idx == i),
+                req_read_value[i].eq(count_of(self._rd_query.data, i)),
+                ins_read_value[i].eq(count_of(self._rd_insert.data, i)),
+            ]
 
         write_addr_next_next = Signal(self.log_block_size)
         write_addr_next = Signal(self.log_block_size)
@@ -155,86 +299,93 @@ class CountHashTab(Elaboratable):
 
         m.d.sync += write_addr_next.eq(write_addr_next_next)
         m.d.sync += write_addr.eq(write_addr_next)
-        with Transaction().body(m):
-            res = self.insert_hash.result(m)
-            with m.If(res["valid"]):
-                for i, rd in enumerate(self._read_ports):
-                    m.d.sync += rd.addr.eq(res["hash"] & address_mask)
-                m.d.sync += [
-                    inc_start.eq(1),
-                    mem_idx_next.eq((res["hash"] >> self.log_block_size)),
-                    write_addr_next_next.eq(res["hash"] & address_mask),
-                ]
+        with m.If(insert_valid):
+            m.d.sync += self._rd_insert.addr.eq(block_addr(insert_hash))
+            m.d.sync += [
+                inc_start.eq(1),
+                fused_start.eq(insert_fused),
+                ins_idx_next.eq(block_idx(insert_hash)),
+                write_addr_next_next.eq(block_addr(insert_hash)),
+            ]
+
+        # Forwarding file: the write sitting in the port and the one
+        # committed a cycle earlier. A read issued less than three cycles
+        # after a write to its bucket misses it, so it takes the newest
+        # matching value from here instead of the memory.
+        prev_en = Signal.like(self._wr.en)
+        prev_addr = Signal.like(self._wr.addr)
+        prev_data = Signal.like(self._wr.data)
+        m.d.sync += [
+            prev_en.eq(self._wr.en),
+            prev_addr.eq(self._wr.addr),
+            prev_data.eq(self._wr.data),
+        ]
 
-        extra_add_write = Signal()
-        m.d.sync += extra_add_write.eq(0)
-        with m.If(
-            insert_writing
-            & (write_addr_next == write_addr)
-            & (mem_idx == mem_idx_before)
-        ):
-            m.d.sync += extra_add_write.eq(1)
+        def forward(lane: int, addr: Value, value: Value) -> Value:
+            return Mux(
+                self._wr.en[lane] & (self._wr.addr == addr),
+                count_of(self._wr.data, lane),
+                Mux(
+                    prev_en[lane] & (prev_addr == addr),
+                    count_of(prev_data, lane),
+                    value,
+                ),
+            )
 
-        for rmul, req_read, wr in zip(read_mult, req_read_value, self._write_ports):
-            with m.If(rmul):
-                m.d.sync += wr.data.eq(req_read + 1 + extra_add_write)
-                m.d.sync += [wr.en.eq(insert_writing), wr.addr.eq(write_addr)]
+        for i, (imul, ins_read) in enumerate(zip(ins_mult, ins_read_value)):
+            with m.If(imul):
+                m.d.sync += self._wr.data.word_select(i, self.entry_width).eq(
+                    Cat(self._increment(forward(i, write_addr, ins_read)), gen)
+                )
+                m.d.sync += [
+                    self._wr.en[i].eq(insert_writing),
+                    self._wr.addr.eq(write_addr),
+                ]
 
         with m.If(clr_waiting > 0):
             m.d.sync += clr_waiting.eq(clr_waiting - 1)
             with m.If(clr_waiting == 1):
-                m.d.sync += clr_running.eq(1)
-                for wr in self._write_ports:
+                # a new generation hides every counter at once; only when it
+                # wraps back to 0 could old stamps match again, so only then
+                # is the memory swept (zero data carries generation 0)
+                m.d.sync += gen.eq(gen + 1)
+                with m.If(gen.all()):
+                    m.d.sync += clr_running.eq(1)
                     m.d.sync += [
-                        wr.en.eq(1),
-                        wr.addr.eq(0),
-                        wr.data.eq(0),
+                        self._wr.en.eq((1 << self.lanes) - 1),
+                        self._wr.addr.eq(0),
+                        self._wr.data.eq(0),
                     ]
         with m.If(clr_running):
-            for wr in self._write_ports:
-                m.d.sync += wr.addr.eq(wr.addr + 1)
-                m.d.sync += wr.data.eq(0)
-                m.d.sync += wr.en.eq(1)
-                with m.If(wr.addr == (1 << self.log_block_size) - 2):
-                    m.d.sync += clr_running.eq(0)
-
-        @def_method(m, self.insert)
-        def _(data):
-            self.insert_hash.input(m, data)
+            m.d.sync += [
+                self._wr.addr.eq(self._wr.addr + 1),
+                self._wr.data.eq(0),
+                self._wr.en.eq((1 << self.lanes) - 1),
+            ]
+            with m.If(self._wr.addr == (1 << self.log_block_size) - 2):
+                m.d.sync += clr_running.eq(0)
 
         req_answer = Signal(self.counter_width)
-        add_inc_before = Signal()
-        add_inc_before2 = Signal()
-        add_inc = Signal(2)
-
-        m.d.sync += add_inc.eq(add_inc_before + add_inc_before2)
-        m.d.sync += add_inc_before.eq(0)
-        m.d.sync += add_inc_before2.eq(0)
-        for i, wr in enumerate(self._write_ports):
-            with m.If(wr.en & (wr.addr == req_adress_before) & (i == mem_idx)):
-                m.d.sync += add_inc_before.eq(1)
-        with m.If(
-            insert_writing
-            & (req_adress_before == write_addr)
-            & (mem_idx == mem_idx_before)
-        ):
-            m.d.sync += add_inc_before2.eq(1)
-
-        for rmul, rw in zip(read_mult, req_read_value):
+        for i, (rmul, rw) in enumerate(zip(read_mult, req_read_value)):
             with m.If(rmul):
-                m.d.sync += req_answer.eq(rw)
+                m.d.sync += req_answer.eq(forward(i, req_adress_before_before, rw))
 
         final_answer = Signal(self.counter_width)
-        m.d.sync += final_answer.eq(req_answer + add_inc)
+        m.d.sync += final_answer.eq(req_answer)
+
+        # an insert_query's incremented count sits in the write port one
+        # cycle before a query issued with it would answer, so it takes
+        # that query's response slot
+        with m.If(fused_written):
+            m.d.sync += req_final_answer_ready.eq(1)
+            for i in range(self.lanes):
+                with m.If(self._wr.en[i]):
+                    m.d.sync += final_answer.eq(count_of(self._wr.data, i))
 
         @def_method(m, self.query_resp)
         def _():
             return {"count": final_answer, "valid": req_final_answer_ready}
 
-        @def_method(m, self.query_req)
-        def _(data):
-            self.query_hash.input(m, data)
-
         @def_method(m, self.clear)
         def _():
             m.d.sync += clr_addr.eq(0)
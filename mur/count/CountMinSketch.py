@@ -1,13 +1,25 @@
 from amaranth import *
 from transactron import *
-from amaranth.utils import ceil_log2
 
 from mur.count.CountHashTab import CountHashTab
 
 # from transactron.lib import logging
 
 # log = logging.HardwareLogger("countminsketch")
-__all__ = ["CountMinSketch"]
+__all__ = ["CountMinSketch", "normalize_hash_params"]
+
+
+def normalize_hash_params(
+    depth: int, hash_params: list[tuple[int, int]] | None
+) -> tuple[tuple[int, int], ...]:
+    """(a, b) pair of every row; defaults to ``(row + 1, 0)``."""
+    if hash_params is None:
+        hash_params = [(idx + 1, 0) for idx in range(depth)]
+    if len(hash_params) < depth:
+        raise ValueError(
+            f"hash_params must provide {depth} (a, b) pairs, got {len(hash_params)}"
+        )
+    return tuple((a, b) for a, b in hash_params[:depth])
 
 
 class CountMinSketch(Elaboratable):
@@ -25,13 +37,27 @@ class CountMinSketch(Elaboratable):
         input_data_width (int): Number of bits in each input data.
         hash_params (list[tuple[int, int]] | None): List of tuples containing
             hash coefficients (a, b) for each row. If None, default values are used.
+        hash_kind (str): Hash family used by every row (see ``HASH_KINDS``).
+        gen_bits (int): Generation stamp width of the rows (see
+            ``CountHashTab``); a clear then only bumps the generation.
+        prehashed (bool): If True the rows have no hash units and
+            ``insert``/``query_req`` take ``hashes``, the 16-bit row hashes
+            packed row 0 first, computed once by the caller.
 
     Methods
     -------
         insert(data: int): Insert data into the sketch.
+            (``insert(hashes)`` if prehashed)
         query_req(data: int): Request a query for the count of data.
+            (``query_req(hashes)`` if prehashed)
         query_resp(): Get the count and valid flag from the last query.
-        clear(): Clear the sketch. Clearing takes at least self.depth + 2 cycles.
+        insert_query(data: int): Insert data and get its updated estimate
+            through ``query_resp``, with one pass over the rows' memories
+            (``insert_query(hashes)`` if prehashed). Cannot share a cycle
+            with ``insert`` or ``query_req``.
+        clear(): Clear the sketch. Rows are cleared in parallel, so clearing
+            takes at least 2**log_block_size + 20 cycles (21 cycles with
+            gen_bits > 0 until the generation wraps).
     """
 
     _P = CountHashTab._P
@@ -45,6 +71,9 @@ class CountMinSketch(Elaboratable):
         input_data_width: int,
         hash_params: list[tuple[int, int]] | None = None,
         log_block_size: int = 11,
+        hash_kind: str = "mod65521",
+        prehashed: bool = False,
+        gen_bits: int = 0,
     ) -> None:
         if depth < 1:
             raise ValueError("depth must be ≥ 1")
@@ -53,15 +82,24 @@ class CountMinSketch(Elaboratable):
         self.width = width
         self.counter_width = counter_width
         self.input_data_width = input_data_width
-
-        self.insert = Method(i=[("data", self.input_data_width)])
-        self.query_req = Method(i=[("data", self.input_data_width)])
+        self.prehashed = prehashed
+
+        # what is latched and forwarded to the rows per operation
+        self._arg, self._arg_width = (
+            ("hashes", 16 * depth) if prehashed else ("data", input_data_width)
+        )
+        self.insert = Method(i=[(self._arg, self._arg_width)])
+        self.query_req = Method(i=[(self._arg, self._arg_width)])
         self.query_resp = Method(o=[("count", self.counter_width), ("valid", 1)])
+        self.insert_query = Method(i=[(self._arg, self._arg_width)])
         self.clear = Method()
+        self.insert_query.add_conflict(self.insert)
+        self.insert_query.add_conflict(self.query_req)
+
+        self.hash_params = normalize_hash_params(depth, hash_params)
 
         self.rows: list[CountHashTab] = []
-        for idx in range(depth):
-            a, b = hash_params[idx] if hash_params is not None else (idx + 1, 0)
+        for idx, (a, b) in enumerate(self.hash_params):
             row = CountHashTab(
                 size=width,
                 counter_width=counter_width,
@@ -69,6 +107,9 @@ class CountMinSketch(Elaboratable):
                 log_block_size=log_block_size,
                 hash_a=a,
                 hash_b=b,
+                hash_kind=hash_kind,
+                prehashed=prehashed,
+                gen_bits=gen_bits,
             )
             setattr(self, f"_row{idx}", row)
             self.rows.append(row)
@@ -77,58 +118,92 @@ class CountMinSketch(Elaboratable):
         m = TModule()
         m.submodules += self.rows
 
+        def row_args(value: Value, idx: int) -> dict[str, Value]:
+            if self.prehashed:
+                return {"hash": value.word_select(idx, 16)}
+            return {"data": value}
+
         insert_next = Signal(1, init=0)
-        insert_next_data = Signal(self.input_data_width, init=0)
+        insert_next_data = Signal(self._arg_width, init=0)
         m.d.sync += insert_next.eq(0)
+
         @def_method(m, self.insert)
-        def _(data):
+        def _(arg):
             m.d.sync += insert_next.eq(1)
-            m.d.sync += insert_next_data.eq(data)
+            m.d.sync += insert_next_data.eq(arg[self._arg])
 
         with Transaction().body(m, request=insert_next):
-            for row in self.rows:
-                row.insert(m, data=insert_next_data)
-
-        min_tree = [Signal(self.counter_width) for _ in range(2 * self.depth)]
-        valid_depth = [Signal(1) for _ in range(ceil_log2(self.depth) + 1)]
+            for idx, row in enumerate(self.rows):
+                row.insert(m, row_args(insert_next_data, idx))
+
+        # registered min tree, one comparator layer per cycle; an odd
+        # element out is carried through a register so every layer holds
+        # the counts of the same query
+        layers = [
+            [Signal(self.counter_width, name=f"min0_{i}") for i in range(self.depth)]
+        ]
+        while len(layers[-1]) > 1:
+            layers.append(
+                [
+                    Signal(self.counter_width, name=f"min{len(layers)}_{i}")
+                    for i in range((len(layers[-1]) + 1) // 2)
+                ]
+            )
+        # valid_depth[k] flags the query held in layers[len(layers) - 1 - k]
+        valid_depth = [Signal(1) for _ in range(len(layers))]
         for i in range(len(valid_depth)):
             if i == len(valid_depth) - 1:
                 m.d.sync += valid_depth[i].eq(0)
             else:
                 m.d.sync += valid_depth[i].eq(valid_depth[i + 1])
-        for i in range(1, self.depth):
-            m.d.sync += min_tree[i].eq(
-                Mux(
-                    min_tree[2 * i] < min_tree[2 * i + 1],
-                    min_tree[2 * i],
-                    min_tree[2 * i + 1],
-                )
-            )
-        # log the whole tree and valid singals
+
+        # a layer only loads while a query flows into it, so the tree does
+        # not toggle on idle cycles
+        for k, (prev, layer) in enumerate(zip(layers, layers[1:])):
+            with m.If(valid_depth[len(layers) - 1 - k]):
+                for i, node in enumerate(layer):
+                    if 2 * i + 1 < len(prev):
+                        a, b = prev[2 * i], prev[2 * i + 1]
+                        m.d.sync += node.eq(Mux(a < b, a, b))
+                    else:
+                        m.d.sync += node.eq(prev[2 * i])
 
         with Transaction().body(m):
             row_results = [row.query_resp(m) for row in self.rows]
-            count_signals = [r["count"] for r in row_results]
-            for i in range(len(count_signals)):
-                m.d.sync += min_tree[self.depth + i].eq(count_signals[i])
+            with m.If(row_results[0]["valid"]):
+                for leaf, r in zip(layers[0], row_results):
+                    m.d.sync += leaf.eq(r["count"])
             m.d.sync += valid_depth[len(valid_depth) - 1].eq(row_results[0]["valid"])
 
         @def_method(m, self.query_resp)
         def _():
-            # log.debug(m,valid_depth[0], "{:x}", min_tree[1])
-            return {"count": min_tree[1], "valid": valid_depth[0]}
+            return {"count": layers[-1][0], "valid": valid_depth[0]}
 
         req_next = Signal(1, init=0)
-        req_next_data = Signal(self.input_data_width, init=0)
+        req_next_data = Signal(self._arg_width, init=0)
         m.d.sync += req_next.eq(0)
+
         @def_method(m, self.query_req)
-        def _(data):
+        def _(arg):
             m.d.sync += req_next.eq(1)
-            m.d.sync += req_next_data.eq(data)
-        
+            m.d.sync += req_next_data.eq(arg[self._arg])
+
         with Transaction().body(m, request=req_next):
-            for row in self.rows:
-                row.query_req(m, data=req_next_data)
+            for idx, row in enumerate(self.rows):
+                row.query_req(m, row_args(req_next_data, idx))
+
+        fused_next = Signal(1, init=0)
+        fused_next_data = Signal(self._arg_width, init=0)
+        m.d.sync += fused_next.eq(0)
+
+        @def_method(m, self.insert_query)
+        def _(arg):
+            m.d.sync += fused_next.eq(1)
+            m.d.sync += fused_next_data.eq(arg[self._arg])
+
+        with Transaction().body(m, request=fused_next):
+            for idx, row in enumerate(self.rows):
+                row.insert_query(m, row_args(fused_next_data, idx))
 
         next_clear = Signal(1, init=0)
         m.d.sync += next_clear.eq(0)
@@ -1,7 +1,10 @@
 from amaranth import *
+from amaranth.utils import ceil_log2
 from transactron import *
 
+from mur.count.BlockedCountMinSketch import BlockedCountMinSketch
 from mur.count.CountMinSketch import CountMinSketch
+from mur.count.hash import HASH_KINDS, Hash, SharedKeyHash
 #from transactron.lib import logging
 
 __all__ = ["RollingCountMinSketch"]
@@ -17,6 +20,11 @@ class RollingCountMinSketch(Elaboratable):
     2. **Query**: This instance is used to query the count of data.
     3. **Clear**: This instance is being cleared so can be used for the next insert.
 
+    The row hashes are computed once here, by one hash unit per row shared by
+    inserts and queries, and handed to the (prehashed) sketches together with
+    the role chosen when the data entered ``input``. For the mod 65521 hash
+    kinds the rows also share the reduction of the key (``SharedKeyHash``).
+
     Atributes
     ----------
         depth (int): Number of hash tables (rows) in the sketch.
@@ -25,13 +33,26 @@ class RollingCountMinSketch(Elaboratable):
         input_data_width (int): Number of bits in each input data.
         hash_params (list[tuple[int, int]] | None): List of tuples containing
             hash coefficients (a, b) for each row. If None, default values are used.
+        hash_kind (str): Hash family used by every row (see ``HASH_KINDS``).
+        blocked (bool): Use BlockedCountMinSketch tiers (one wide memory access
+            per operation, clearing takes width + 20 cycles).
+        slots (int): Counters per row in a block when ``blocked``.
+        conservative_update (bool): Only bump the rows at the key's minimum
+            (requires ``blocked``).
+        gen_bits (int): Generation stamp width of the CountHashTab rows, so a
+            role change clears a sketch without sweeping it (not with
+            ``blocked``).
+        double_hashing (bool): Evaluate only the first two hash functions and
+            derive row ``i`` as ``h0 + i * (h1 | 1)`` (Kirsch–Mitzenmacher),
+            so the hash logic no longer grows with depth.
 
     Methods
     -------
         set_mode(mode: int): Set the mode of the sketch (0 for insert, 1 for query).
-        change_roles(): Change the roles of the CountMinSketch instances so the insert
-            instance becomes the query instance, the query instance becomes the clear
-            instance, and the clear instance becomes the insert instance.
+        change_roles(enable: int): If enable is set, change the roles of the CountMinSketch
+            instances so the insert instance becomes the query instance, the query instance
+            becomes the clear instance, and the clear instance becomes the insert instance.
+            Otherwise nothing happens, so callers do not need a conditional call.
         input(data: int): Insert data into the sketch or request a query for the count of data depending
             on the current mode.
         output(): Get the count and valid flag from the last query.
@@ -46,75 +67,129 @@ class RollingCountMinSketch(Elaboratable):
         input_data_width: int,
         hash_params: list[tuple[int, int]] | None = None,
         log_block_size: int = 11,
+        hash_kind: str = "mod65521",
+        blocked: bool = False,
+        slots: int = 4,
+        double_hashing: bool = False,
+        conservative_update: bool = False,
+        gen_bits: int = 0,
     ) -> None:
+        if conservative_update and not blocked:
+            raise ValueError("conservative_update requires blocked=True")
+        if gen_bits and blocked:
+            raise ValueError("gen_bits is not supported with blocked=True")
+
         self.depth = depth
         self.width = width
         self.counter_width = counter_width
         self.item_width = input_data_width
 
         self.set_mode = Method(i=[("mode", 1)])
-        self.change_roles = Method()
+        self.change_roles = Method(i=[("enable", 1)])
         self.input = Method(i=[("data", self.item_width)], o=[("mode", 1)])
         self.output = Method(o=[("count", self.counter_width), ("valid", 1)])
 
-        self._cms0 = CountMinSketch(
-            depth=depth,
-            width=width,
-            counter_width=counter_width,
-            input_data_width=self.item_width,
-            hash_params=hash_params,
-            log_block_size=log_block_size,
-        )
-        self._cms1 = CountMinSketch(
-            depth=depth,
-            width=width,
-            counter_width=counter_width,
-            input_data_width=self.item_width,
-            hash_params=hash_params,
-            log_block_size=log_block_size,
-        )
-        self._cms2 = CountMinSketch(
-            depth=depth,
-            width=width,
-            counter_width=counter_width,
-            input_data_width=self.item_width,
-            hash_params=hash_params,
-            log_block_size=log_block_size,
-        )
+        self._cms: list[CountMinSketch | BlockedCountMinSketch] = []
+        for idx in range(3):
+            if blocked:
+                cms = BlockedCountMinSketch(
+                    depth=depth,
+                    width=width,
+                    counter_width=counter_width,
+                    input_data_width=self.item_width,
+                    hash_params=hash_params,
+                    slots=slots,
+                    hash_kind=hash_kind,
+                    prehashed=True,
+                    conservative_update=conservative_update,
+                )
+            else:
+                cms = CountMinSketch(
+                    depth=depth,
+                    width=width,
+                    counter_width=counter_width,
+                    input_data_width=self.item_width,
+                    hash_params=hash_params,
+                    log_block_size=log_block_size,
+                    hash_kind=hash_kind,
+                    prehashed=True,
+                    gen_bits=gen_bits,
+                )
+            setattr(self, f"_cms{idx}", cms)
+            self._cms.append(cms)
+        self.hash_params = self._cms[0].hash_params
+
+        self.double_hashing = double_hashing
+        hash_cls = HASH_KINDS[hash_kind]
+        base_params = self.hash_params[:2] if double_hashing else self.hash_params
+        if issubclass(hash_cls, Hash):
+            # x mod 65521 does not depend on (a, b): reduce the key once
+            self._hashes = [
+                SharedKeyHash(
+                    input_width=self.item_width,
+                    params=list(base_params),
+                    fold_width=hash_cls.fold_width,
+                )
+            ]
+        else:
+            self._hashes = [
+                hash_cls(input_width=self.item_width, a=a, b=b) for a, b in base_params
+            ]
 
         self._head = Signal(range(3), init=0)
         self._mode = Signal(1, init=0)
 
     def elaborate(self, platform):
         m = TModule()
-        m.submodules += [self._cms0, self._cms1, self._cms2]
+        m.submodules += [*self._cms, *self._hashes]
+
+        # (mode, head) of every item still inside the hash pipeline, oldest
+        # at rd_ptr; an item is routed after `latency` cycles, so a ring of
+        # more than `latency` entries never overwrites a live one
+        latency = max(h.latency for h in self._hashes)
+        ring = 1 << ceil_log2(latency + 1)
+        route_mode = Array(Signal(1, name=f"route_mode{i}") for i in range(ring))
+        route_head = Array(Signal(range(3), name=f"route_head{i}") for i in range(ring))
+        wr_ptr = Signal(range(ring))
+        rd_ptr = Signal(range(ring))
 
         @def_method(m, self.input)
         def _(data):
-            with m.If(self._mode == 0):
-                with m.Switch(self._head):
-                    with m.Case(0):
-                        self._cms0.insert(m, data=data)
-                    with m.Case(1):
-                        self._cms1.insert(m, data=data)
-                    with m.Case(2):
-                        self._cms2.insert(m, data=data)
-            with m.Else():
-
-                with m.Switch(self._head):
-                    with m.Case(0):
-                        self._cms1.query_req(m, data=data)
-                    with m.Case(1):
-                        self._cms2.query_req(m, data=data)
-                    with m.Case(2):
-                        self._cms0.query_req(m, data=data)
+            for h in self._hashes:
+                h.input(m, data=data)
+            m.d.sync += [
+                route_mode[wr_ptr].eq(self._mode),
+                route_head[wr_ptr].eq(self._head),
+                wr_ptr.eq(wr_ptr + 1),
+            ]
             return {"mode": self._mode}
 
+        with Transaction().body(m):
+            results = [h.result(m) for h in self._hashes]
+            # 16 bits per evaluated row, row 0 first
+            base = Cat(r["hash"] for r in results)
+            if self.double_hashing and self.depth > 1:
+                # odd step, so the rows of one key never collapse onto h0
+                h0, step = base[:16], base[16:32] | 1
+                hashes = Cat((h0 + i * step)[:16] for i in range(self.depth))
+            else:
+                hashes = base
+            with m.If(results[0]["valid"]):
+                m.d.sync += rd_ptr.eq(rd_ptr + 1)
+                with m.If(route_mode[rd_ptr] == 0):
+                    with m.Switch(route_head[rd_ptr]):
+                        for idx, cms in enumerate(self._cms):
+                            with m.Case(idx):
+                                cms.insert(m, hashes=hashes)
+                with m.Else():
+                    with m.Switch(route_head[rd_ptr]):
+                        for idx in range(3):
+                            with m.Case(idx):
+                                self._cms[(idx + 1) % 3].query_req(m, hashes=hashes)
+
         @def_method(m, self.output)
         def _():
-            r0 = self._cms0.query_resp(m)
-            r1 = self._cms1.query_resp(m)
-            r2 = self._cms2.query_resp(m)
+            r0, r1, r2 = [cms.query_resp(m) for cms in self._cms]
 
             count = Mux(
                 r0["valid"],
@@ -132,18 +207,16 @@ class RollingCountMinSketch(Elaboratable):
             }
 
         @def_method(m, self.change_roles)
-        def _():
+        def _(enable):
             cur_query = (self._head + 1) % 3
 
-            m.d.sync += self._head.eq((self._head + 2) % 3)
+            with m.If(enable):
+                m.d.sync += self._head.eq((self._head + 2) % 3)
 
-            with m.Switch(cur_query):
-                with m.Case(0):
-                    self._cms0.clear(m)
-                with m.Case(1):
-                    self._cms1.clear(m)
-                with m.Case(2):
-                    self._cms2.clear(m)
+                with m.Switch(cur_query):
+                    for idx, cms in enumerate(self._cms):
+                        with m.Case(idx):
+                            cms.clear(m)
 
         @def_method(m, self.set_mode)
         def _(mode):
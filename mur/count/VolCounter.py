@@ -12,15 +12,23 @@ class VolCounter(Elaboratable):
     It is used to detect if the traffic volume of samples exceeds a certain threshold
     which could indicate a potential attack or anomaly.
 
+    With ``lanes > 1`` every ``add_sample`` call carries ``lanes`` packed
+    samples (lane 0 in the least significant bits), which are summed with
+    an adder tree, and the window advances by ``lanes`` sample slots per
+    cycle.
+
     Attributes
     ----------
-        window (int): The size of the sliding window.
+        window (int): The size of the sliding window in sample slots.
         threshold (int): The threshold for the volume counter.
-        input_width (int): The width of the input data.
+        input_width (int): The width of a single sample.
+        lanes (int): Number of samples accepted per cycle. ``window`` must
+            be a multiple of it.
 
     Methods
     -------
-        add_sample(data: int): Add a sample to the volume counter.
+        add_sample(data: int): Add samples to the volume counter.
+            (input_width * lanes bits)
         result(): Get the result of the volume counter.
     """
 
@@ -30,29 +38,36 @@ class VolCounter(Elaboratable):
         window: int,
         threshold: int,
         input_width: int = 16,
+        lanes: int = 1,
     ) -> None:
         if window < 1:
             raise ValueError("window must be ≥ 1")
         if input_width < 1:
             raise ValueError("input_width must be ≥ 1")
+        if lanes < 1:
+            raise ValueError("lanes must be ≥ 1")
+        if window % lanes:
+            raise ValueError("window must be a multiple of lanes")
 
         self.window = window
         self.threshold = threshold
         self.input_width = input_width
+        self.lanes = lanes
+        self.cycles = window // lanes
 
         worst_case_bits = input_width + ceil_log2(window)
         self.sum_width = worst_case_bits
 
-        self.add_sample = Method(i=[("data", input_width)])
+        self.add_sample = Method(i=[("data", input_width * lanes)])
         self.result = Method(o=[("mode", 1)])
 
     def elaborate(self, platform):
         m = TModule()
 
-        counter = Signal(range(self.window))
+        counter = Signal(range(self.cycles))
         acc = Signal(self.sum_width)
 
-        with m.If(counter == self.window - 1):
+        with m.If(counter == self.cycles - 1):
             m.d.sync += counter.eq(0)
             m.d.sync += acc.eq(0)
         with m.Else():
@@ -60,14 +75,20 @@ class VolCounter(Elaboratable):
 
         @def_method(m, self.add_sample)
         def _add_sample(data):
-            with m.If(~(counter == self.window - 1)):
-                m.d.sync += acc.eq(acc + data)
+            # balanced adder tree over the packed lanes
+            terms = [data.word_select(i, self.input_width) for i in range(self.lanes)]
+            while len(terms) > 1:
+                pairs = zip(terms[0::2], terms[1::2])
+                terms = [a + b for a, b in pairs] + terms[len(terms) & ~1 :]
+            total = terms[0]
+            with m.If(~(counter == self.cycles - 1)):
+                m.d.sync += acc.eq(acc + total)
             with m.Else():
-                m.d.sync += acc.eq(data)
+                m.d.sync += acc.eq(total)
 
         mode = Signal(1)
         mode_set_ready = Signal()
-        m.d.sync += mode_set_ready.eq((counter + 1) == (self.window - 1))
+        m.d.sync += mode_set_ready.eq((counter + 1) == (self.cycles - 1))
         m.d.sync += mode.eq(acc > self.threshold)
 
         @def_method(m, self.result, ready=mode_set_ready)
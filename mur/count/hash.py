@@ -1,52 +1,505 @@
+from random import Random
+
 from amaranth import *
+from amaranth.lib.memory import Memory as memory
 from transactron import Method, def_method, TModule, Transaction
-from mur.count.mod65521 import Mod65521
+from mur.count.mod65521 import _P, Mod65521, fold_mod65521
+
+
+
+__all__ = [
+    "Hash",
+    "XorFoldHash",
+    "SharedKeyHash",
+    "FMix32Hash",
+    "MultiplyShiftHash",
+    "TabulationHash",
+    "Mersenne31Hash",
+    "CRCHash",
+    "HASH_KINDS",
+]
+
 
+def _xor_fold32(data: Value, width: int) -> Value:
+    """XOR of the 32-bit words of ``data`` (the last one zero-extended)."""
+    words = [data[i : i + 32] for i in range(0, width, 32)]
+    folded = words[0]
+    for word in words[1:]:
+        folded = folded ^ word
+    return folded
 
 
-__all__ = ["Hash"]
+def _carter_wegman(
+    m: TModule, key: Value, key_valid: Value, a: Const, b: Const
+) -> tuple[Signal, Signal]:
+    """
+    ``(a * key + b) mod 65521`` of a key already reduced mod 65521, one
+    register stage per operation. Returns the hash and its valid flag.
+    """
+    prod_valid = Signal(init=0)
+    prod = Signal(32, init=0)
+    mul_valid = Signal(init=0)
+    mul_result = Signal(32, init=0)
+    fold_valid = Signal(init=0)
+    hash_valid = Signal(init=0)
+    hash_result = Signal(16, init=0)
+
+    # multiply and add in separate register stages (the M and P registers
+    # of a DSP multiply-add; the Mod65521 result is the input register)
+    m.d.sync += [
+        prod.eq(a * key),
+        prod_valid.eq(key_valid),
+        mul_result.eq(prod + b),
+        mul_valid.eq(prod_valid),
+    ]
+
+    # a * x + b < 2**32: two pseudo-Mersenne folds and one subtract
+    # instead of a second limb-serial Mod65521 pipeline
+    folded_expr, bound = fold_mod65521(mul_result, (1 << 32) - 1)
+    folded = Signal(bound.bit_length())
+    m.d.sync += [
+        folded.eq(folded_expr),
+        fold_valid.eq(mul_valid),
+        hash_result.eq(Mux(folded >= 65_521, folded - 65_521, folded)),
+        hash_valid.eq(fold_valid),
+    ]
+    return hash_result, hash_valid
 
 
 class Hash(Elaboratable):
+    # width the key is XOR-folded to before the modulo; None keeps all bits
+    fold_width: int | None = None
+
     def __init__(self, *, input_width: int = 64, a: int = 1, b: int = 0) -> None:
-        if input_width not in (32, 48, 64):
-            raise ValueError("input_width must be 32/48/64")
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
 
         self.input_width = input_width
-        self._a = Signal(16, init=a)
-        self._b = Signal(16, init=b)
+        self.key_width = input_width
+        if self.fold_width is not None:
+            self.key_width = min(input_width, self.fold_width)
+        # cycles from input to a valid result: the Mod65521 reduction of the
+        # key and the four Carter-Wegman stages
+        self.latency = (self.key_width + 15) // 16 + 6
+        # coefficients are fixed at elaboration: reduce them here, once, so
+        # they fit 16 bits and the multiplier sees plain constants
+        self._a = C(a % _P, 16)
+        self._b = C(b % _P, 16)
 
         self.input = Method(i=[("data", input_width)])
         self.result = Method(o=[("hash", 16), ("valid", 1)])
 
     def elaborate(self, platform):
         m = TModule()
-        mod_in = Mod65521(input_width=self.input_width)
-        mod_out = Mod65521(input_width=32)
-        m.submodules += [mod_in, mod_out]
+        mod_in = Mod65521(input_width=self.key_width)
+        m.submodules += mod_in
+
+        @def_method(m, self.input)
+        def _(data):
+            if self.key_width < self.input_width:
+                data = _xor_fold32(data, self.input_width)
+            mod_in.input(m, data=data)
+
+        key = Signal(16)
+        key_valid = Signal()
+        with Transaction().body(m):
+            res = mod_in.result(m)
+            m.d.comb += [key.eq(res["mod"]), key_valid.eq(res["valid"])]
+        hash_result, hash_valid = _carter_wegman(m, key, key_valid, self._a, self._b)
+
+        @def_method(m, self.result)
+        def _():
+            return {"hash": hash_result, "valid": hash_valid}
+
+        return m
 
-        mul_valid = Signal(init=0)
-        mul_result = Signal(32, init=0)
+
+class XorFoldHash(Hash):
+    """
+    ``Hash`` of the key XOR-folded to 32 bits. Wide keys then need a
+    two-limb ``Mod65521`` instead of one limb per 16 input bits; the
+    universal hash behind it still mixes the folded value.
+    """
+
+    fold_width = 32
+
+
+class SharedKeyHash(Elaboratable):
+    """
+    Several ``Hash`` rows over the same key: the key is reduced mod 65521
+    once, since that stage does not depend on ``(a, b)``, and only the
+    multiply-add-reduce tail is built per row. ``result`` returns the row
+    hashes packed row 0 first, with the same values and latency as one
+    ``Hash`` per row.
+
+    Attributes
+    ----------
+        input_width (int): Number of bits in each input data.
+        params (list[tuple[int, int]]): Coefficients (a, b) of every row.
+        fold_width (int | None): XOR-fold the key to this width before the
+            reduction (``Hash.fold_width`` of the row class).
+    """
+
+    def __init__(
+        self,
+        *,
+        input_width: int = 64,
+        params: list[tuple[int, int]],
+        fold_width: int | None = None,
+    ) -> None:
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
+        if not params:
+            raise ValueError("params must hold at least one (a, b) pair")
+
+        self.input_width = input_width
+        self.key_width = input_width
+        if fold_width is not None:
+            self.key_width = min(input_width, fold_width)
+        # the same as one Hash per row
+        self.latency = (self.key_width + 15) // 16 + 6
+        self._coeffs = [(C(a % _P, 16), C(b % _P, 16)) for a, b in params]
+
+        self.input = Method(i=[("data", input_width)])
+        self.result = Method(o=[("hash", 16 * len(params)), ("valid", 1)])
+
+    def elaborate(self, platform):
+        m = TModule()
+        mod_in = Mod65521(input_width=self.key_width)
+        m.submodules += mod_in
 
         @def_method(m, self.input)
         def _(data):
+            if self.key_width < self.input_width:
+                data = _xor_fold32(data, self.input_width)
             mod_in.input(m, data=data)
 
-        m.d.sync += mul_valid.eq(0)
+        key = Signal(16)
+        key_valid = Signal()
         with Transaction().body(m):
-            mod0_res = mod_in.result(m)
-            with m.If(mod0_res["valid"]):
-                m.d.sync += [
-                    mul_result.eq(self._a * mod0_res["mod"] + self._b),
-                    mul_valid.eq(1),
-                ]
+            res = mod_in.result(m)
+            m.d.comb += [key.eq(res["mod"]), key_valid.eq(res["valid"])]
+        rows = [_carter_wegman(m, key, key_valid, a, b) for a, b in self._coeffs]
+
+        @def_method(m, self.result)
+        def _():
+            return {"hash": Cat(h for h, _ in rows), "valid": rows[0][1]}
+
+        return m
+
 
-        with Transaction().body(m, request=mul_valid):
-            mod_out.input(m, data=mul_result)
+class FMix32Hash(Elaboratable):
+    """
+    Murmur3 ``fmix32`` finaliser over the input XOR-folded to 32 bits.
+    No modular reduction: two constant multiplies and three xor-shifts,
+    one register stage each. ``a`` and ``b`` form a 32-bit seed
+    ``Cat(a, b)`` that is XOR-ed into the folded key so rows stay
+    independent. Same methods as ``Hash``; the low 16 bits are returned.
+    """
+
+    C1 = 0x85EB_CA6B
+    C2 = 0xC2B2_AE35
+
+    def __init__(self, *, input_width: int = 64, a: int = 1, b: int = 0) -> None:
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
+
+        self.input_width = input_width
+        # fixed at elaboration: a constant seed, not a register
+        self._a = C(a, 16)
+        self._b = C(b, 16)
+        # cycles from input to a valid result
+        self.latency = 4
+
+        self.input = Method(i=[("data", input_width)])
+        self.result = Method(o=[("hash", 16), ("valid", 1)])
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        stages = [Signal(32, name=f"h{i}") for i in range(4)]
+        valid = [Signal(name=f"h{i}_valid") for i in range(4)]
+        m.d.sync += valid[0].eq(0)
+        for i in range(1, 4):
+            m.d.sync += valid[i].eq(valid[i - 1])
+
+        @def_method(m, self.input)
+        def _(data):
+            folded = _xor_fold32(data, self.input_width)
+            m.d.sync += [
+                stages[0].eq(folded ^ Cat(self._a, self._b)),
+                valid[0].eq(1),
+            ]
+
+        h0, h1, h2, h3 = stages
+        m.d.sync += [
+            h1.eq((h0 ^ (h0 >> 16)) * self.C1),
+            h2.eq((h1 ^ (h1 >> 13)) * self.C2),
+            h3.eq(h2 ^ (h2 >> 16)),
+        ]
 
         @def_method(m, self.result)
         def _():
-            res = mod_out.result(m)
-            return {"hash": res["mod"], "valid": res["valid"]}
+            return {"hash": h3[:16], "valid": valid[3]}
 
         return m
+
+
+class MultiplyShiftHash(Elaboratable):
+    """
+    Dietzfelbinger multiply-add-shift hash ``(A * x + B) mod 2**32 >> 16``
+    over the input XOR-folded to 32 bits: one multiply, no reduction. The
+    odd multiplier ``A`` and the offset ``B`` are spread from ``a`` and
+    ``b`` at construction. The top product bits are the good ones, so the
+    16 result bits come reversed: a table indexed by the low ``k`` bits of
+    the hash uses the top ``k`` bits of the product.
+    """
+
+    SPREAD_A = 0x9E37_79B1
+    SPREAD_B = 0x85EB_CA77
+
+    def __init__(self, *, input_width: int = 64, a: int = 1, b: int = 0) -> None:
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
+
+        self.input_width = input_width
+        self.mul = (a * self.SPREAD_A | 1) & 0xFFFF_FFFF
+        self.add = (b * self.SPREAD_B) & 0xFFFF_FFFF
+        # cycles from input to a valid result
+        self.latency = 2
+
+        self.input = Method(i=[("data", input_width)])
+        self.result = Method(o=[("hash", 16), ("valid", 1)])
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        key = Signal(32)
+        key_valid = Signal()
+        product = Signal(32)
+        product_valid = Signal()
+        m.d.sync += [key_valid.eq(0), product_valid.eq(key_valid)]
+
+        @def_method(m, self.input)
+        def _(data):
+            m.d.sync += [
+                key.eq(_xor_fold32(data, self.input_width)),
+                key_valid.eq(1),
+            ]
+
+        m.d.sync += product.eq(key * self.mul + self.add)
+
+        @def_method(m, self.result)
+        def _():
+            return {
+                "hash": Cat(product[31 - i] for i in range(16)),
+                "valid": product_valid,
+            }
+
+        return m
+
+
+class TabulationHash(Elaboratable):
+    """
+    Simple tabulation hash over the input XOR-folded to 32 bits: each byte
+    indexes its own 256-entry table of random 16-bit words and the four
+    words are XOR-ed. No multiplier and no reduction, just four small
+    memory reads. The tables are filled at construction from a PRNG seeded
+    with ``a`` and ``b``, so rows with different coefficients are
+    independent. Same methods as ``Hash``.
+    """
+
+    BYTES = 4
+
+    def __init__(self, *, input_width: int = 64, a: int = 1, b: int = 0) -> None:
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
+
+        self.input_width = input_width
+        self.tables = self.tables_for(a, b)
+        self._mems = [memory(shape=16, depth=256, init=t) for t in self.tables]
+        # cycles from input to a valid result
+        self.latency = 2
+
+        self.input = Method(i=[("data", input_width)])
+        self.result = Method(o=[("hash", 16), ("valid", 1)])
+
+    @classmethod
+    def tables_for(cls, a: int, b: int) -> list[list[int]]:
+        """The byte tables used for coefficients ``(a, b)``."""
+        rng = Random(f"tabulation:{a}:{b}")
+        return [[rng.getrandbits(16) for _ in range(256)] for _ in range(cls.BYTES)]
+
+    def elaborate(self, platform):
+        m = TModule()
+        m.submodules += self._mems
+
+        ports = [mem.read_port(domain="sync") for mem in self._mems]
+        read_valid = Signal()
+        hash_result = Signal(16)
+        hash_valid = Signal()
+        m.d.sync += read_valid.eq(0)
+
+        @def_method(m, self.input)
+        def _(data):
+            # zero-extended, so narrow keys still give every table a byte
+            key = Cat(_xor_fold32(data, self.input_width), C(0, 32))
+            for i, port in enumerate(ports):
+                m.d.comb += port.addr.eq(key.word_select(i, 8))
+            m.d.sync += read_valid.eq(1)
+
+        folded = ports[0].data
+        for port in ports[1:]:
+            folded = folded ^ port.data
+        m.d.sync += [hash_result.eq(folded), hash_valid.eq(read_valid)]
+
+        @def_method(m, self.result)
+        def _():
+            return {"hash": hash_result, "valid": hash_valid}
+
+        return m
+
+
+class Mersenne31Hash(Elaboratable):
+    """
+    Carter-Wegman hash ``(a * x + b) mod (2**31 - 1)`` over the input
+    XOR-folded to 32 bits. Reducing modulo a Mersenne prime is
+    ``(v & P) + (v >> 31)``: two such folds and one conditional subtract,
+    no divider and no limb-serial pre-reduction of the key. Same methods as
+    ``Hash``; the low 16 bits of the residue are returned.
+    """
+
+    P = (1 << 31) - 1
+
+    def __init__(self, *, input_width: int = 64, a: int = 1, b: int = 0) -> None:
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
+
+        self.input_width = input_width
+        self._a = C(a % self.P, 31)
+        self._b = C(b % self.P, 31)
+        # cycles from input to a valid result
+        self.latency = 5
+
+        self.input = Method(i=[("data", input_width)])
+        self.result = Method(o=[("hash", 16), ("valid", 1)])
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        key = Signal(32)
+        prod = Signal(63)
+        total = Signal(64)
+        folded = Signal(32)
+        hash_result = Signal(16)
+        valid = [Signal(name=f"stage{i}_valid") for i in range(5)]
+        m.d.sync += valid[0].eq(0)
+        for i in range(1, 5):
+            m.d.sync += valid[i].eq(valid[i - 1])
+
+        @def_method(m, self.input)
+        def _(data):
+            m.d.sync += [
+                key.eq(_xor_fold32(data, self.input_width)),
+                valid[0].eq(1),
+            ]
+
+        # a * x + b < 2**64; each fold maps v to a value congruent mod P:
+        # below 2**34 after the first, below P + 8 after the second
+        once = (total & self.P) + (total >> 31)
+        twice = (once & self.P) + (once >> 31)
+        m.d.sync += [
+            prod.eq(self._a * key),
+            total.eq(prod + self._b),
+            folded.eq(twice),
+            hash_result.eq(Mux(folded >= self.P, folded - self.P, folded)),
+        ]
+
+        @def_method(m, self.result)
+        def _():
+            return {"hash": hash_result, "valid": valid[4]}
+
+        return m
+
+
+class CRCHash(Elaboratable):
+    """
+    CRC-16 of the whole key (MSB first, no reflection) computed in one
+    cycle. The CRC is linear over GF(2), so every output bit is an XOR of
+    input bits chosen at elaboration, plus a constant from the initial
+    value: no multiplier, no reduction, and no key folding. A row uses
+    ``POLYS[(a - 1) % len(POLYS)]``, so the default ``(row + 1, 0)``
+    parameters give every row its own polynomial and hence its own
+    collisions, and ``b`` as the initial value. Same methods as ``Hash``.
+    """
+
+    # CRC-16 ARC, CCITT, DNP, T10-DIF, CDMA2000, DECT, TELEDISK, OPENSAFETY-A
+    POLYS = (0x8005, 0x1021, 0x3D65, 0x8BB7, 0xC867, 0x0589, 0xA097, 0x5935)
+
+    def __init__(self, *, input_width: int = 64, a: int = 1, b: int = 0) -> None:
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
+
+        self.input_width = input_width
+        self.poly = self.POLYS[(a - 1) % len(self.POLYS)]
+        self.init = b & 0xFFFF
+        # cycles from input to a valid result
+        self.latency = 1
+
+        self.input = Method(i=[("data", input_width)])
+        self.result = Method(o=[("hash", 16), ("valid", 1)])
+
+    def _crc(self, x: int, init: int) -> int:
+        crc = init
+        for i in reversed(range(self.input_width)):
+            feedback = (crc >> 15) ^ (x >> i) & 1
+            crc = (crc << 1) & 0xFFFF
+            if feedback:
+                crc ^= self.poly
+        return crc
+
+    def elaborate(self, platform):
+        m = TModule()
+
+        # crc(x) = crc(0 with init) ^ XOR of crc(bit i, init 0) over set bits
+        offset = self._crc(0, self.init)
+        columns = [self._crc(1 << i, 0) for i in range(self.input_width)]
+        hash_result = Signal(16)
+        hash_valid = Signal()
+        m.d.sync += hash_valid.eq(0)
+
+        @def_method(m, self.input)
+        def _(data):
+            bits = []
+            for j in range(16):
+                taps = [data[i] for i, col in enumerate(columns) if col >> j & 1]
+                bits.append(Cat(taps).xor() if taps else C(0, 1))
+            m.d.sync += [
+                hash_result.eq(Cat(bits) ^ offset),
+                hash_valid.eq(1),
+            ]
+
+        @def_method(m, self.result)
+        def _():
+            return {"hash": hash_result, "valid": hash_valid}
+
+        return m
+
+
+HASH_KINDS: dict[
+    str,
+    type[Hash]
+    | type[FMix32Hash]
+    | type[MultiplyShiftHash]
+    | type[TabulationHash]
+    | type[Mersenne31Hash]
+    | type[CRCHash],
+] = {
+    "mod65521": Hash,
+    "xorfold65521": XorFoldHash,
+    "fmix32": FMix32Hash,
+    "multiply_shift": MultiplyShiftHash,
+    "tabulation": TabulationHash,
+    "mersenne31": Mersenne31Hash,
+    "crc16": CRCHash,
+}
@@ -1,57 +1,83 @@
 from amaranth import *
 from transactron import Method, def_method, TModule
 
-__all__ = ["Mod65521"]
+__all__ = ["Mod65521", "fold_mod65521"]
+
+
+_P = 65_521
+
+
+def fold_mod65521(value: Value, bound: int) -> tuple[Value, int]:
+    """
+    Fold ``value`` (at most ``bound``) using 2**16 ≡ 15 (mod 65521) until a
+    single conditional subtract of the prime reduces it. Returns the folded
+    expression and its new bound.
+    """
+    while bound >= 2 * _P:
+        value = (value & 0xFFFF) + (((value >> 16) << 4) - (value >> 16))
+        bound = 0xFFFF + 15 * (bound >> 16)
+    return value, bound
 
 
 class Mod65521(Elaboratable):
     def __init__(self, *, input_width: int = 64) -> None:
-        if input_width not in (32, 48, 64):
-            raise ValueError("input_width must be 32/48/64")
+        if input_width < 1:
+            raise ValueError("input_width must be ≥ 1")
         self.input_width = input_width
+        # Inputs are processed in 16-bit limbs; a ragged top limb is zero-padded
+        self.limb_count = (input_width + 15) // 16
+        # cycles from input to a valid result: input register, one Horner
+        # stage per limb and the final subtract
+        self.latency = self.limb_count + 2
         self.input = Method(i=[("data", input_width)])
         self.result = Method(o=[("mod", 16), ("valid", 1)])
 
     def elaborate(self, platform):
         m = TModule()
-        limbs = [[Signal(16, name=f"limb{i}_{j}") for i in range(self.input_width // 16)] for j in range(self.input_width // 16)]
-        val = [Signal(1, name=f"val{i}") for i in range(3 + (self.input_width // 16))]
-        nxt = [Signal(28, name=f"nxt{i}") for i in range(4)]
+        n = self.limb_count
+        limbs = [[Signal(16, name=f"limb{i}_{j}") for i in range(n)] for j in range(n)]
+        val = [Signal(1, name=f"val{i}") for i in range(2 + n)]
         for i in range(len(val)):
             if i == 0:
                 m.d.sync += val[i].eq(0)
             else:
                 m.d.sync += val[i].eq(val[i - 1])
         
-        for i in range(self.input_width // 16):
-            for j in range(self.input_width // 16):
+        for i in range(n):
+            for j in range(n):
                 if i == 0:
                     m.d.sync += limbs[i][j].eq(0)
                 else:
                     m.d.sync += limbs[i][j].eq(limbs[i - 1][j])
         @def_method(m, self.input)
         def _(data):
-            for i in range(self.input_width // 16):
-                rev = self.input_width // 16 - i - 1
+            if n * 16 != self.input_width:
+                data = Cat(data, C(0, n * 16 - self.input_width))
+            for i in range(n):
+                rev = n - i - 1
                 m.d.sync += limbs[0][rev].eq(data.word_select(i, 16))
             m.d.sync += val[0].eq(1)
 
-        for idx in range(self.input_width // 16):
+        # Horner step nxt = 15 * nxt + limb (2**16 ≡ 15 mod P), folded once
+        # per stage so the accumulator stays below 2P for any input width
+        nxt = []
+        for idx in range(n):
             if idx == 0:
-                m.d.sync += nxt[idx].eq(limbs[0][0])
+                acc, bound = limbs[0][0], 0xFFFF
             else:
-                m.d.sync += nxt[idx].eq((nxt[idx - 1] << 4) - nxt[idx - 1] + limbs[idx][idx])
-        folded = Signal(18)
-        last_index = self.input_width // 16 - 1
-        m.d.sync += folded.eq(
-            (nxt[last_index] & 0xFFFF)
-            + (((nxt[last_index] >> 16) << 4) - (nxt[last_index] >> 16))
-        )
+                prev = nxt[idx - 1]
+                acc, bound = fold_mod65521(
+                    (prev << 4) - prev + limbs[idx][idx], 15 * bound + 0xFFFF
+                )
+            stage = Signal(bound.bit_length(), name=f"nxt{idx}")
+            m.d.sync += stage.eq(acc)
+            nxt.append(stage)
+        folded = nxt[n - 1]
 
         @def_method(m, self.result)
         def _():
             result = Signal(16)
-            m.d.sync += result.eq(Mux(folded >= 65_521, folded - 65_521, folded))
+            m.d.sync += result.eq(Mux(folded >= _P, folded - _P, folded))
             return {"mod": result, "valid": val[len(val) - 1]}
 
         return m
@@ -28,7 +28,8 @@ class ParserCMSVol(Elaboratable):
     ----------
         depth (int): Number of hash tables (rows) in the sketch.
         width (int): The size of CountHashTab (number of hash buckets).
-        counter_width (int): Number of bits in each counter.
+        counter_width (int): Number of bits in each counter. Counters
+            saturate, so 16 bits are plenty for a heavy-hitter decision.
         hash_params (list[tuple[int, int]] | None): List of tuples containing
             hash coefficients (a, b) for each row. If None, default values are used.
         window (int): The size of the sliding window for the volume counter.
@@ -51,7 +52,7 @@ class ParserCMSVol(Elaboratable):
         *,
         depth: int = 8,
         width: int = 2**14,
-        counter_width: int = 32,
+        counter_width: int = 16,
         hash_params: list[tuple[int, int]] | None = None,
         window: int = 2**16,
         volume_threshold: int = 100_000,
@@ -0,0 +1,143 @@
+from random import randint, random, seed
+from collections import deque
+
+from transactron.testing import TestCaseWithSimulator, SimpleTestCircuit
+
+from mur.count.BlockedCountMinSketch import BlockedCountMinSketch
+
+
+class TestBlockedCountMinSketch(TestCaseWithSimulator):
+    """Randomised functional test‑bench for ``BlockedCountMinSketch``.
+
+    Same mixed *insert* / *query* / *clear* trace as *test_countminsketch.py*,
+    checked against a Python model of the blocked layout: row 0's hash picks
+    the block, and every lane's slot comes from its own row hash, just above
+    the block index bits.
+    """
+
+    conservative_update = False
+
+    # ──────────────────────────────────────────────────────────────
+    #  Stimulus generation
+    # ──────────────────────────────────────────────────────────────
+    def setup_method(self):
+        seed(42)
+
+        # ── Design parameters ─────────────────────────────────────
+        self.depth = 4  # lanes per block
+        self.width = 2**9  # blocks
+        self.slots = 4  # counters per lane
+        self.counter_width = 32
+        self.data_width = 32
+
+        self.hash_params = [(row + 1, 0) for row in range(self.depth)]
+        P = 65521
+        block_bits = (self.width - 1).bit_length()
+
+        def cells(x: int) -> list[tuple[int, int, int]]:
+            """(block, lane, slot) of every counter touched by *x*."""
+            hashes = [(a * x + b) % P for a, b in self.hash_params]
+            block = hashes[0] % self.width
+            return [
+                (block, lane, (h >> block_bits) % self.slots)
+                for lane, h in enumerate(hashes)
+            ]
+
+        # block -> lane -> slot counters (reference model)
+        self.model = [
+            [[0] * self.slots for _ in range(self.depth)] for _ in range(self.width)
+        ]
+
+        # ── Random operation trace ────────────────────────────────
+        self.operation_count = 10_000
+        self.ops: list[tuple[str, int | None]] = []
+        self.expected = deque()  # queued QUERY responses
+
+        clear_interval = 300
+        next_clear_at = randint(clear_interval // 2, clear_interval * 3 // 2)
+
+        for i in range(self.operation_count):
+            if i == next_clear_at:
+                # -------------- CLEAR ----------------------------
+                self.ops.append(("clear", None))
+                for block in self.model:
+                    for lane in block:
+                        lane[:] = [0] * self.slots
+                next_clear_at += randint(clear_interval // 2, clear_interval * 3 // 2)
+                continue
+
+            data = randint(0, (1 << self.data_width) - 1)
+            if random() < 0.65:
+                # -------------- INSERT ---------------------------
+                self.ops.append(("insert", data))
+                touched = cells(data)
+                floor = min(self.model[b][l][s] for b, l, s in touched)
+                for block, lane, slot in touched:
+                    if not self.conservative_update:
+                        self.model[block][lane][slot] += 1
+                    elif self.model[block][lane][slot] == floor:
+                        self.model[block][lane][slot] += 1
+            else:
+                # -------------- QUERY ----------------------------
+                self.ops.append(("query", data))
+                est = min(
+                    self.model[block][lane][slot] for block, lane, slot in cells(data)
+                )
+                self.expected.append({"count": est})
+
+    # ──────────────────────────────────────────────────────────────
+    #  Driver process
+    # ──────────────────────────────────────────────────────────────
+    async def driver_process(self, sim):
+        """Feeds INSERT / QUERY_REQ / CLEAR transactions into the DUT."""
+        for kind, data in self.ops:
+            while random() >= 0.7:  # idle cycles to rattle corner‑cases
+                await sim.tick()
+
+            if kind == "insert":
+                await self.dut.insert.call_try(sim, {"data": data})
+
+            elif kind == "query":
+                await self.dut.query_req.call_try(sim, {"data": data})
+
+            else:  # kind == "clear"
+                await self.dut.clear.call_try(sim, {})
+                # Allow the DUT time to sweep the memory
+                for _ in range(self.width + 25):
+                    await sim.tick()
+
+    # ──────────────────────────────────────────────────────────────
+    #  Checker process
+    # ──────────────────────────────────────────────────────────────
+    async def checker_process(self, sim):
+        """Pulls QUERY_RESP results and checks them against *expected*."""
+        while self.expected:
+            resp = await self.dut.query_resp.call_try(sim)
+            if resp["valid"] == 0:
+                continue
+            assert resp["count"] == self.expected.popleft()["count"]
+
+    # ──────────────────────────────────────────────────────────────
+    #  Top‑level test
+    # ──────────────────────────────────────────────────────────────
+    def test_randomised(self):
+        core = BlockedCountMinSketch(
+            depth=self.depth,
+            width=self.width,
+            counter_width=self.counter_width,
+            input_data_width=self.data_width,
+            hash_params=self.hash_params,
+            slots=self.slots,
+            conservative_update=self.conservative_update,
+        )
+        self.dut = SimpleTestCircuit(core)
+
+        with self.run_simulation(self.dut) as sim:
+            sim.add_testbench(self.driver_process)
+            sim.add_testbench(self.checker_process)
+
+
+class TestBlockedCountMinSketchConservative(TestBlockedCountMinSketch):
+    """Same trace with conservative update: only the minimal lanes grow."""
+
+    conservative_update = True
@@ -79,6 +79,9 @@ class TestCMSVolController(TestCaseWithSimulator):
         # Shared position counters for coroutines
         self._in_idx = 0  # next packet to *send* into the DUT
         self._out_idx = 0  # next packet to *decide* upon from the DUT
+        # sink back-pressure: pause for stall_cycles after every stall_every reads
+        self.stall_every = 0
+        self.stall_cycles = 0
 
     # ------------------------------------------------------------------
     #  Driver – pushes SRC/DST/DPORT/LEN quadruples into the DUT
@@ -109,7 +112,12 @@ class TestCMSVolController(TestCaseWithSimulator):
     #  Sink – pulls *decisions* and assembles the filtered capture
     # ------------------------------------------------------------------
     async def _sink_process(self, sim):
+        reads = 0
         while self._out_idx < len(self.packets):
+            if self.stall_every and reads % self.stall_every == 0:
+                for _ in range(self.stall_cycles):
+                    await sim.tick()
+            reads += 1
             resp = await self.dut.out.call(sim)  # back‑pressure
 
             val = int(resp["data"])
@@ -148,3 +156,25 @@ class TestCMSVolController(TestCaseWithSimulator):
         # After simulation, write resulting capture --------------------
         wrpcap("filtered_output.pcap", self.filtered)
         print(f"Filtered pcap written with {len(self.filtered)} packets.")
+
+    def test_filter_stalled_out(self):
+        # Query mode from the first window on, while out() is left unread
+        # long enough for the out FIFO to fill with queries still in flight.
+        # Every decision must still come out, one per query packet.
+        core = CMSVolController(
+            depth=4,
+            width=1024,
+            counter_width=32,
+            window=64,
+            volume_threshold=0,
+            fifo_depth=16,
+        )
+        self.dut = SimpleTestCircuit(core)
+        self.stall_every = 24
+        self.stall_cycles = 300
+
+        with self.run_simulation(self.dut) as sim:
+            sim.add_testbench(self._driver_process)
+            sim.add_testbench(self._sink_process)
+
+        assert self._out_idx == len(self.packets)
@@ -18,6 +18,13 @@ class TestCountHashTab(TestCaseWithSimulator):
       clear-sweeps.
     """
 
+    size = 2**9  # number of hash buckets
+    key_count = 1 << 32  # inserted/queried keys are drawn from range(key_count)
+    counter_width = 32
+    gen_bits = 0
+    # share of inserts issued as insert_query (answered with the new count)
+    fused_ratio = 0.0
+
     # ------------------------------------------------------------------
     #  Stimulus generation
     # ------------------------------------------------------------------
@@ -26,14 +33,12 @@ class TestCountHashTab(TestCaseWithSimulator):
         seed(42)
 
         # ── DUT parameters ────────────────────────────────────────────
-        self.size = 2**9  # number of hash buckets
-        self.counter_width = 32
         self.data_width = 32
 
         # ── Random operation trace ------------------------------------
         self.operation_count = 5000
         #               kind          payload
-        #   ops[i]  = ("insert"|"query"|"clear",  data:int | None)
+        #   ops[i]  = ("insert"|"insert_query"|"query"|"clear",  data:int | None)
         self.ops: list[tuple[str, int | None]] = []
 
         # Expected QUERY responses in arrival order
@@ -63,14 +68,19 @@ class TestCountHashTab(TestCaseWithSimulator):
 
             if random() < 0.65:
                 # ----------- INSERT -----------------------------------
-                data = randint(0, (1 << self.data_width) - 1)
-                self.ops.append(("insert", data))
-                self.model[h(data)] += 1
+                data = randint(0, self.key_count - 1)
+                limit = (1 << self.counter_width) - 1  # counters saturate
+                self.model[h(data)] = min(self.model[h(data)] + 1, limit)
+                if self.fused_ratio and random() < self.fused_ratio:
+                    self.ops.append(("insert_query", data))
+                    self.expected.append({"count": self.model[h(data)]})
+                else:
+                    self.ops.append(("insert", data))
                 print(f"insert: {h(data)}")
 
             else:
                 # ----------- QUERY ------------------------------------
-                data = randint(0, (1 << self.data_width) - 1)
+                data = randint(0, self.key_count - 1)
                 self.ops.append(("query", data))
                 self.expected.append({"count": self.model[h(data)]})
                 print(f" query: {[h(data)]} -> {self.model[h(data)]}")
@@ -90,6 +100,8 @@ class TestCountHashTab(TestCaseWithSimulator):
 
             if kind == "insert":
                 await self.dut.insert.call_try(sim, {"data": data})
+            elif kind == "insert_query":
+                await self.dut.insert_query.call_try(sim, {"data": data})
             elif kind == "query":
                 await self.dut.query_req.call_try(sim, {"data": data})
 
@@ -123,9 +135,42 @@ class TestCountHashTab(TestCaseWithSimulator):
             log_block_size=8,
             hash_a=self.a,
             hash_b=self.b,
+            gen_bits=self.gen_bits,
         )
         self.dut = SimpleTestCircuit(core)
 
         with self.run_simulation(self.dut) as sim:
             sim.add_testbench(self.driver_process)
             sim.add_testbench(self.checker_process)
+
+
+class TestCountHashTabSingleBlock(TestCountHashTab):
+    """Table smaller than one memory block (log_block_size is capped)."""
+
+    size = 2**7
+
+
+class TestCountHashTabHotKeys(TestCountHashTab):
+    """A handful of keys, so inserts hit the same bucket back to back."""
+
+    key_count = 4
+
+
+class TestCountHashTabHotKeysFused(TestCountHashTabHotKeys):
+    """Hot keys with half the inserts answered through insert_query, so
+    fused, plain inserts and queries chase the same bucket."""
+
+    fused_ratio = 0.5
+
+
+class TestCountHashTabSaturate(TestCountHashTab):
+    """One key and 8-bit counters: the bucket saturates between clears."""
+
+    key_count = 1
+    counter_width = 8
+
+
+class TestCountHashTabGenerations(TestCountHashTab):
+    """Generation-stamped clears, wrapping (and sweeping) every 4 clears."""
+
+    gen_bits = 2
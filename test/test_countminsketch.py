@@ -16,6 +16,10 @@ class TestCountMinSketch(TestCaseWithSimulator):
     clears.
     """
 
+    depth = 4  # number of hash rows
+    # share of inserts issued as insert_query (answered with the new estimate)
+    fused_ratio = 0.0
+
     # ──────────────────────────────────────────────────────────────
     #  Stimulus generation
     # ──────────────────────────────────────────────────────────────
@@ -23,7 +27,6 @@ class TestCountMinSketch(TestCaseWithSimulator):
         seed(42)
 
         # ── Design parameters ─────────────────────────────────────
-        self.depth = 4  # number of hash rows
         self.width = 2**9  # buckets per row
         self.counter_width = 32
         self.data_width = 32
@@ -43,7 +46,7 @@ class TestCountMinSketch(TestCaseWithSimulator):
         # ── Random operation trace ────────────────────────────────
         self.operation_count = 10_000
         #                  kind          payload
-        #   ops[i] = ("insert"|"query"|"clear",  int | None)
+        #   ops[i] = ("insert"|"insert_query"|"query"|"clear",  int | None)
         self.ops: list[tuple[str, int | None]] = []
         self.expected = deque()  # queued QUERY responses
 
@@ -63,9 +66,17 @@ class TestCountMinSketch(TestCaseWithSimulator):
             if random() < 0.65:
                 # -------------- INSERT ---------------------------
                 data = randint(0, (1 << self.data_width) - 1)
-                self.ops.append(("insert", data))
                 for row_idx in range(self.depth):
                     self.model[row_idx][h(row_idx, data)] += 1
+                if self.fused_ratio and random() < self.fused_ratio:
+                    self.ops.append(("insert_query", data))
+                    est = min(
+                        self.model[row_idx][h(row_idx, data)]
+                        for row_idx in range(self.depth)
+                    )
+                    self.expected.append({"count": est})
+                else:
+                    self.ops.append(("insert", data))
             else:
                 # -------------- QUERY ----------------------------
                 data = randint(0, (1 << self.data_width) - 1)
@@ -88,6 +99,9 @@ class TestCountMinSketch(TestCaseWithSimulator):
             if kind == "insert":
                 await self.dut.insert.call_try(sim, {"data": data})
 
+            elif kind == "insert_query":
+                await self.dut.insert_query.call_try(sim, {"data": data})
+
             elif kind == "query":
                 await self.dut.query_req.call_try(sim, {"data": data})
 
@@ -131,3 +145,15 @@ class TestCountMinSketch(TestCaseWithSimulator):
         with self.run_simulation(self.dut) as sim:
             sim.add_testbench(self.driver_process)
             sim.add_testbench(self.checker_process)
+
+
+class TestCountMinSketchInsertQuery(TestCountMinSketch):
+    """Half of the inserts also answer with their post-increment estimate."""
+
+    fused_ratio = 0.5
+
+
+class TestCountMinSketchOddDepth(TestCountMinSketch):
+    """Three rows: the min tree carries an unpaired row through a layer."""
+
+    depth = 3
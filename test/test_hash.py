@@ -1,8 +1,19 @@
+from abc import ABC, abstractmethod
 from parameterized import parameterized_class
 from random import randint, seed, random
 
+from amaranth import Elaboratable
 from transactron.testing import TestCaseWithSimulator, SimpleTestCircuit
-from mur.count.hash import Hash
+from mur.count.hash import (
+    Hash,
+    XorFoldHash,
+    SharedKeyHash,
+    FMix32Hash,
+    MultiplyShiftHash,
+    TabulationHash,
+    Mersenne31Hash,
+    CRCHash,
+)
 
 MOD65521 = 65_521  # Prime used by the RTL implementation
 
@@ -12,14 +23,37 @@ def ref_hash(x: int, a: int, b: int) -> int:
     return (a * x + b) % MOD65521
 
 
-@parameterized_class(("input_width",), [(32,), (48,), (64,)])
-class TestHash(TestCaseWithSimulator):
+def xor_fold32(x: int, width: int) -> int:
+    """XOR of the 32‑bit words of *x*."""
+    h = 0
+    for shift in range(0, width, 32):
+        h ^= (x >> shift) & 0xFFFF_FFFF
+    return h
+
+
+def ref_fmix32(x: int, a: int, b: int, width: int) -> int:
+    """Golden‑model fmix32 over the key XOR‑folded to 32 bits, seeded by (a, b)."""
+    h = xor_fold32(x, width) ^ (a | (b << 16))
+    h ^= h >> 16
+    h = (h * FMix32Hash.C1) & 0xFFFF_FFFF
+    h ^= h >> 13
+    h = (h * FMix32Hash.C2) & 0xFFFF_FFFF
+    h ^= h >> 16
+    return h & 0xFFFF
+
+
+class _HashTestBase(TestCaseWithSimulator, ABC):
     input_width: int
+    hash_cls: type[Elaboratable]
+    a = 7
+    b = 1234
+
+    @abstractmethod
+    def ref(self, x: int) -> int:
+        """Golden-model hash of ``x`` for the parameters of this variant."""
 
     def setup_method(self):
         seed(42)
-        self.a = 7
-        self.b = 1234
         self.sample_count = 10000
         self.inputs = []
         self.expected = []
@@ -36,12 +70,12 @@ class TestHash(TestCaseWithSimulator):
         for x in edge_cases:
             masked = x & ((1 << self.input_width) - 1)
             self.inputs.append(masked)
-            self.expected.append(ref_hash(masked, self.a, self.b))
+            self.expected.append(self.ref(masked))
 
         for _ in range(self.sample_count - len(edge_cases)):
             x = randint(0, (1 << self.input_width) - 1)
             self.inputs.append(x)
-            self.expected.append(ref_hash(x, self.a, self.b))
+            self.expected.append(self.ref(x))
 
         self._in_idx = 0
         self._out_idx = 0
@@ -66,8 +100,127 @@ class TestHash(TestCaseWithSimulator):
                 self._out_idx += 1
 
     def test_randomised(self):
-        core = Hash(input_width=self.input_width, a=self.a, b=self.b)
+        core = self.hash_cls(input_width=self.input_width, a=self.a, b=self.b)
+        self.dut = SimpleTestCircuit(core)
+        with self.run_simulation(self.dut) as sim:
+            sim.add_testbench(self._driver)
+            sim.add_testbench(self._checker)
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,)])
+class TestHash(_HashTestBase):
+    hash_cls = Hash
+
+    def ref(self, x: int) -> int:
+        return ref_hash(x, self.a, self.b)
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestXorFoldHash(_HashTestBase):
+    hash_cls = XorFoldHash
+
+    def ref(self, x: int) -> int:
+        return ref_hash(xor_fold32(x, self.input_width), self.a, self.b)
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestSharedKeyHash(_HashTestBase):
+    """Three rows over one key reduction, XOR-folded like ``XorFoldHash``."""
+
+    hash_cls = SharedKeyHash
+    params = [(7, 1234), (3, 0), (65_530, 99)]
+
+    def ref(self, x: int) -> int:
+        key = xor_fold32(x, self.input_width)
+        return sum(
+            ref_hash(key, a, b) << (16 * row) for row, (a, b) in enumerate(self.params)
+        )
+
+    def test_randomised(self):
+        core = SharedKeyHash(
+            input_width=self.input_width,
+            params=self.params,
+            fold_width=XorFoldHash.fold_width,
+        )
         self.dut = SimpleTestCircuit(core)
         with self.run_simulation(self.dut) as sim:
             sim.add_testbench(self._driver)
             sim.add_testbench(self._checker)
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestFMix32Hash(_HashTestBase):
+    hash_cls = FMix32Hash
+
+    def ref(self, x: int) -> int:
+        return ref_fmix32(x, self.a, self.b, self.input_width)
+
+
+def ref_multiply_shift(x: int, a: int, b: int, width: int) -> int:
+    """Golden‑model multiply‑shift: top 16 product bits, bit‑reversed."""
+    mul = (a * MultiplyShiftHash.SPREAD_A | 1) & 0xFFFF_FFFF
+    add = (b * MultiplyShiftHash.SPREAD_B) & 0xFFFF_FFFF
+    top = ((xor_fold32(x, width) * mul + add) & 0xFFFF_FFFF) >> 16
+    return int(f"{top:016b}"[::-1], 2)
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestMultiplyShiftHash(_HashTestBase):
+    hash_cls = MultiplyShiftHash
+
+    def ref(self, x: int) -> int:
+        return ref_multiply_shift(x, self.a, self.b, self.input_width)
+
+
+def ref_tabulation(x: int, tables: list[list[int]], width: int) -> int:
+    """Golden‑model tabulation hash: XOR of one table entry per folded byte."""
+    key = xor_fold32(x, width)
+    h = 0
+    for i, table in enumerate(tables):
+        h ^= table[(key >> (8 * i)) & 0xFF]
+    return h
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestTabulationHash(_HashTestBase):
+    hash_cls = TabulationHash
+
+    def setup_method(self):
+        # the sample loop in the base setup calls ref, so build these first
+        self.tables = TabulationHash.tables_for(self.a, self.b)
+        super().setup_method()
+
+    def ref(self, x: int) -> int:
+        return ref_tabulation(x, self.tables, self.input_width)
+
+
+def ref_mersenne31(x: int, a: int, b: int, width: int) -> int:
+    """Golden‑model hash mod 2**31 − 1 of the key XOR‑folded to 32 bits."""
+    P = Mersenne31Hash.P
+    return ((a % P) * xor_fold32(x, width) + b % P) % P & 0xFFFF
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestMersenne31Hash(_HashTestBase):
+    hash_cls = Mersenne31Hash
+
+    def ref(self, x: int) -> int:
+        return ref_mersenne31(x, self.a, self.b, self.input_width)
+
+
+def ref_crc16(x: int, poly: int, init: int, width: int) -> int:
+    """Golden‑model bit‑serial CRC‑16 of *x*, MSB first, no reflection."""
+    crc = init
+    for i in reversed(range(width)):
+        crc ^= ((x >> i) & 1) << 15
+        crc = ((crc << 1) ^ (poly if crc & 0x8000 else 0)) & 0xFFFF
+    return crc
+
+
+@parameterized_class(("input_width",), [(32,), (48,), (64,), (66,)])
+class TestCRCHash(_HashTestBase):
+    hash_cls = CRCHash
+
+    def ref(self, x: int) -> int:
+        poly = CRCHash.POLYS[(self.a - 1) % len(CRCHash.POLYS)]
+        return ref_crc16(x, poly, self.b, self.input_width)
@@ -13,7 +13,7 @@ from mur.count.mod65521 import (
 
 @parameterized_class(
     ("input_width",),
-    [(32,), (48,), (64,)],
+    [(32,), (48,), (64,), (66,)],
 )
 class TestMod65521(TestCaseWithSimulator):
     input_width: int
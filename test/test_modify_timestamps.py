@@ -0,0 +1,19 @@
+import pytest
+
+from example_pcaps.modify_timestamps import make_times_func
+
+
+class TestMakeTimesFunc:
+    """``--expr`` evaluation in *example_pcaps/modify_timestamps.py*."""
+
+    def test_no_int64_wraparound(self):
+        # idx**7 no longer fits in int64 from idx = 512 on
+        times = make_times_func("idx**7 * 1e-12")
+        expected = [i**7 * 1e-12 for i in range(4096)]
+        assert times(0, 4096) == pytest.approx(expected, rel=1e-12)
+
+    def test_per_packet_fallback(self):
+        # bitwise operators need ints, so the chunk is evaluated per packet
+        times = make_times_func("(idx & 1) * 0.5 + idx**5")
+        expected = [(i & 1) * 0.5 + i**5 for i in range(4096, 8192)]
+        assert times(4096, 4096) == expected
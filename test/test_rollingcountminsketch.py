@@ -17,6 +17,11 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
     background CLEAR sweep finishes before the next rotation.
     """
 
+    double_hashing = False
+    data_width = 32
+    blocked = False
+    conservative_update = False
+
     # ------------------------------------------------------------------
     #  Stimulus generation
     # ------------------------------------------------------------------
@@ -25,21 +30,42 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
 
         # ── Sketch parameters ──────────────────────────────────────────
         self.depth = 4
-        self.width = 2**10
+        # blocked tiers sweep one block per cycle, so keep them short
+        # enough to be cleared between two role changes
+        self.width = 2**7 if self.blocked else 2**10
+        self.slots = 4
         self.counter_width = 32
-        self.data_width = 32
         self.hash_params = [(row + 1, 0) for row in range(self.depth)]
         self.P = 65521
+        block_bits = (self.width - 1).bit_length()
 
-        def h(row: int, x: int) -> int:
+        def base(row: int, x: int) -> int:
             """Software copy of the 32‑bit universal hash used on‑chip."""
             a, b = self.hash_params[row]
-            return ((a * x + b) % self.P) % self.width
+            return (a * x + b) % self.P
+
+        def h(row: int, x: int) -> int:
+            """16-bit row hash handed to the sketches."""
+            if self.double_hashing:
+                step = base(1, x) | 1
+                return (base(0, x) + row * step) & 0xFFFF
+            return base(row, x)
+
+        def cells(x: int) -> list[tuple[int, int, int]]:
+            """(bucket, row, slot) of every counter touched by *x*."""
+            hashes = [h(row, x) for row in range(self.depth)]
+            if not self.blocked:
+                return [(hv % self.width, row, 0) for row, hv in enumerate(hashes)]
+            block = hashes[0] % self.width
+            return [
+                (block, row, (hv >> block_bits) % self.slots)
+                for row, hv in enumerate(hashes)
+            ]
 
         # ── Three rolling sketches (reference model) ------------------
-        self.model = [[[0] * self.width for _ in range(self.depth)] for _ in range(3)]
+        self.model = [{} for _ in range(3)]  # cell -> count, absent = 0
         self.head = 0  # index (0‒2) of the current UPDATE sketch
-        self.mode = 0  # 0 = UPDATE, 1 = QUERY
+        self.mode = 0  # 0 = UPDATE, 1 = QUERY
 
         # ── Random operation trace ------------------------------------
         self.operation_count = 20_000
@@ -51,9 +77,11 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
         for i in range(self.operation_count):
             # -------------- Possibly rotate roles --------------------
             if (i - last_change_at) >= (2**8 + 30) and random() < 0.02:
-                self._rotate_reference()  # update the model first
-                self.ops.append(("change_roles", None))
-                last_change_at = i
+                enable = int(random() < 0.8)  # enable=0 must be a no-op
+                if enable:
+                    self._rotate_reference()  # update the model first
+                    last_change_at = i
+                self.ops.append(("change_roles", enable))
                 continue
 
             # -------------- Possibly toggle mode ---------------------
@@ -67,16 +95,17 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
             if self.mode == 0:
                 self.ops.append(("insert", data))
                 # ------------ UPDATE model --------------------------
-                for row in range(self.depth):
-                    idx = h(row, data)
-                    self.model[self.head][row][idx] += 1
+                sketch = self.model[self.head]
+                touched = cells(data)
+                floor = min(sketch.get(c, 0) for c in touched)
+                for c in touched:
+                    if not self.conservative_update or sketch.get(c, 0) == floor:
+                        sketch[c] = sketch.get(c, 0) + 1
             else:
                 self.ops.append(("query", data))
                 # ------------ QUERY model ---------------------------
-                q_idx = (self.head + 1) % 3
-                est = min(
-                    self.model[q_idx][row][h(row, data)] for row in range(self.depth)
-                )
+                sketch = self.model[(self.head + 1) % 3]
+                est = min(sketch.get(c, 0) for c in cells(data))
                 self.expected.append({"count": est})
 
     # ------------------------------------------------------------------
@@ -85,10 +114,7 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
     def _rotate_reference(self):
         """Mimic the DUT behaviour on ``change_roles``."""
         # Sketch that **was** QUERY gets cleared
-        cur_query = (self.head + 1) % 3
-        for row in self.model[cur_query]:
-            for idx in range(self.width):
-                row[idx] = 0
+        self.model[(self.head + 1) % 3].clear()
         # Advance roles (UPDATE → QUERY → CLEAR → UPDATE …)
         self.head = (self.head + 2) % 3
 
@@ -108,7 +134,7 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
                 await self.dut.set_mode.call_try(sim, {"mode": data})
 
             else:  # kind == "change_roles"
-                await self.dut.change_roles.call_try(sim, {})
+                await self.dut.change_roles.call_try(sim, {"enable": data})
                 # No extra wait here — the "width" spacing is handled
                 # by the pre‑generated operation trace.
 
@@ -136,9 +162,38 @@ class TestRollingCountMinSketch(TestCaseWithSimulator):
             input_data_width=self.data_width,
             hash_params=self.hash_params,
             log_block_size=8,
+            blocked=self.blocked,
+            slots=self.slots,
+            double_hashing=self.double_hashing,
+            conservative_update=self.conservative_update,
         )
         self.dut = SimpleTestCircuit(core)
 
         with self.run_simulation(self.dut) as sim:
             sim.add_testbench(self.driver_process)
             sim.add_testbench(self.checker_process)
+
+
+class TestRollingCountMinSketchDoubleHashing(TestRollingCountMinSketch):
+    """Same trace with rows derived from two base hashes."""
+
+    double_hashing = True
+
+
+class TestRollingCountMinSketchWideKey(TestRollingCountMinSketch):
+    """Keys wide enough that the hash takes more than 16 cycles, so the
+    routing ring has to grow with the hash latency."""
+
+    data_width = 192
+
+
+class TestRollingCountMinSketchBlocked(TestRollingCountMinSketch):
+    """Same trace with BlockedCountMinSketch tiers."""
+
+    blocked = True
+
+
+class TestRollingCountMinSketchBlockedConservative(TestRollingCountMinSketchBlocked):
+    """Blocked tiers with conservative update: only the minimal rows grow."""
+
+    conservative_update = True
@@ -3,17 +3,23 @@
 from random import randint, random, seed
 from collections import deque
 
+from parameterized import parameterized_class
+
 from transactron.testing import TestCaseWithSimulator, SimpleTestCircuit
 from mur.count.VolCounter import VolCounter
 
 
+@parameterized_class(("lanes",), [(1,), (4,)])
 class TestVolCounter(TestCaseWithSimulator):
     """
     Randomised functional test-bench for ``VolCounter`` that now injects
     random *idle* cycles.  Every idle «sim.tick()» is interpreted as a
-    zero-valued sample in the reference model.
+    zero-valued sample in the reference model.  With ``lanes > 1`` every
+    event packs that many samples into one ``add_sample`` call.
     """
 
+    lanes: int
+
     # ──────────────────────────────────────────────────────────────
     #  Stimulus & reference model
     # ──────────────────────────────────────────────────────────────
@@ -27,24 +33,28 @@ class TestVolCounter(TestCaseWithSimulator):
 
         # -- Generate raw data samples --
         raw_count = 20_480  # only *real* samples
-        raw_stream = [randint(0, (1 << self.input_width) - 1) for _ in range(raw_count)]
+        raw_stream = [
+            [randint(0, (1 << self.input_width) - 1) for _ in range(self.lanes)]
+            for _ in range(raw_count // self.lanes)
+        ]
 
         # -- Interleave idle cycles (prob. 0.6 per gap) --
-        self.events: list[int | None] = []  # None ⇒ idle tick
+        self.events: list[list[int] | None] = []  # None ⇒ idle tick
         idle_prob = 0.3
         for value in raw_stream:
             while random() < idle_prob:  # 0 – N idles
                 self.events.append(None)
             self.events.append(value)
 
-        # -- Reference window accumulator --
+        # -- Reference window accumulator (window counts cycles of lanes) --
         self.expected = deque()
+        cycles = self.window // self.lanes
         acc = 0
         cnt = 1
         for ev in self.events:
-            acc += ev or 0  # idle ⇒ 0
+            acc += sum(ev or [])  # idle ⇒ 0
             cnt += 1
-            if cnt == self.window:
+            if cnt == cycles:
                 self.expected.append({"mode": 1 if acc > self.threshold else 0})
                 acc = cnt = 0
 
@@ -56,8 +66,11 @@ class TestVolCounter(TestCaseWithSimulator):
         for ev in self.events:
             if ev is None:  # idle ⇒ just a clock
                 await sim.tick()
-            else:  # active sample
-                await self.dut.add_sample.call_try(sim, {"data": ev})
+            else:  # active sample(s), lane 0 in the low bits
+                data = 0
+                for lane, value in enumerate(ev):
+                    data |= value << (lane * self.input_width)
+                await self.dut.add_sample.call_try(sim, {"data": data})
 
     # ──────────────────────────────────────────────────────────────
     #  Checker : verify every RESULT
@@ -77,6 +90,7 @@ class TestVolCounter(TestCaseWithSimulator):
                 window=self.window,
                 threshold=self.threshold,
                 input_width=self.input_width,
+                lanes=self.lanes,
             )
         )
         with self.run_simulation(self.dut) as sim: